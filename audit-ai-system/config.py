@@ -14,5 +14,8 @@ class Settings:
     GEMINI_MODEL: str = "gemini-2.5-flash"  # or "gemini-2.5-flash-preview-04-17"
     EMBEDDING_MODEL: str = "models/text-embedding-004"  # or "models/embedding-001"
     EMBEDDING_DIMENSION: int = 768  # text-embedding-004 uses 768 dimensions
+    
+    # PDF ingestion
+    PDF_CONCURRENCY: int = int(os.getenv("PDF_CONCURRENCY", "8"))
 
 settings = Settings()
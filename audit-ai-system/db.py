@@ -0,0 +1,59 @@
+import json
+import asyncio
+import asyncpg
+from pgvector.asyncpg import register_vector
+from config import settings
+
+# Global pool instance, created on first use inside the running event loop
+pool = None
+
+# Serializes pool creation so concurrent first callers don't each build one
+_pool_lock = asyncio.Lock()
+
+async def _init_connection(conn):
+    """Register pgvector codecs so embeddings bind as native vectors, not JSON text"""
+    await register_vector(conn)
+    # Decode jsonb (chunk metadata) to dicts, as PostgREST does
+    await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+async def get_pool() -> asyncpg.Pool:
+    """Initialize and return the asyncpg pool for hot-path queries"""
+    global pool
+    if pool is None:
+        async with _pool_lock:
+            if pool is None:
+                pool = await asyncpg.create_pool(
+                    settings.DATABASE_URL,
+                    min_size=2,
+                    max_size=20,
+                    init=_init_connection
+                )
+    return pool
+
+async def close_pool():
+    """Close the pool on application shutdown"""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+async def match_document(query_embedding, match_count: int):
+    """Call the match_document function directly, returning rows shaped like the PostgREST RPC result"""
+    db_pool = await get_pool()
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            "select id, content, metadata, embedding, similarity "
+            "from match_document($1::halfvec, $2)",
+            query_embedding,
+            match_count
+        )
+    return [
+        {
+            'id': str(row['id']),
+            'content': row['content'],
+            'metadata': row['metadata'],
+            'embedding': row['embedding'].to_list(),
+            'similarity': row['similarity']
+        }
+        for row in rows
+    ]
@@ -1,9 +1,16 @@
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from routers import audit, assistant
 from routers import agents
+import db
 
+# Show INFO logs from the service modules (uvicorn only configures its own loggers)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
 
 app = FastAPI(
     title="AutonomIQ Audit AI System",
@@ -44,6 +51,10 @@ async def root():
         "status": "running"
     }
 
+@app.on_event("shutdown")
+async def close_db_pool():
+    await db.close_pool()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
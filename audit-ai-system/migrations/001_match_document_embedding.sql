@@ -0,0 +1,30 @@
+-- match_document: also return the stored chunk embedding so the agents can
+-- score retrieved chunks against their trigger phrases locally.
+drop function if exists match_document(vector, jsonb);
+
+create or replace function match_document(
+  query_embedding vector(768),
+  filter jsonb default '{}'
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  embedding vector(768),
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    document_chunks.id,
+    document_chunks.chunk_text as content,
+    document_chunks.metadata,
+    document_chunks.embedding,
+    1 - (document_chunks.embedding <=> query_embedding) as similarity
+  from document_chunks
+  where document_chunks.metadata @> filter
+  order by document_chunks.embedding <=> query_embedding;
+end;
+$$;
@@ -0,0 +1,46 @@
+-- HNSW index on document_chunks.embedding for match_document.
+-- m=24 / ef_construction=128 trades a slower build for higher recall;
+-- ef_search=100 is applied per query inside match_document.
+
+-- Give the build enough memory and workers (session-local)
+set maintenance_work_mem = '2GB';
+set max_parallel_maintenance_workers = 7;
+
+drop index if exists idx_chunks_embedding_hnsw;
+create index idx_chunks_embedding_hnsw
+  on document_chunks
+  using hnsw (embedding vector_cosine_ops)
+  with (m = 24, ef_construction = 128);
+
+reset maintenance_work_mem;
+reset max_parallel_maintenance_workers;
+
+create or replace function match_document(
+  query_embedding vector(768),
+  filter jsonb default '{}'
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  embedding vector(768),
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- Transaction-local, so it only affects this search
+  perform set_config('hnsw.ef_search', '100', true);
+
+  return query
+  select
+    document_chunks.id,
+    document_chunks.chunk_text as content,
+    document_chunks.metadata,
+    document_chunks.embedding,
+    1 - (document_chunks.embedding <=> query_embedding) as similarity
+  from document_chunks
+  where document_chunks.metadata @> filter
+  order by document_chunks.embedding <=> query_embedding;
+end;
+$$;
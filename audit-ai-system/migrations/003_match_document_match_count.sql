@@ -0,0 +1,40 @@
+-- match_document: take the result size as an argument so LIMIT is applied
+-- inside the function, next to ORDER BY on the raw distance. This lets the
+-- planner serve the query from the HNSW index instead of sorting every row.
+-- match_count defaults to NULL (no limit) for callers that still limit
+-- client-side, e.g. LangChain's SupabaseVectorStore.
+
+-- Adding a parameter creates an overload, so drop the old signature first
+drop function if exists match_document(vector, jsonb);
+
+create or replace function match_document(
+  query_embedding vector(768),
+  match_count int default null,
+  filter jsonb default '{}'
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  embedding vector(768),
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- Transaction-local, so it only affects this search
+  perform set_config('hnsw.ef_search', '100', true);
+
+  return query
+  select
+    document_chunks.id,
+    document_chunks.chunk_text as content,
+    document_chunks.metadata,
+    document_chunks.embedding,
+    1 - (document_chunks.embedding <=> query_embedding) as similarity
+  from document_chunks
+  where document_chunks.metadata @> filter
+  order by document_chunks.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
@@ -0,0 +1,57 @@
+-- Store chunk embeddings as halfvec (FP16) instead of vector (FP32).
+-- Halves the table and HNSW index footprint with negligible recall loss;
+-- HNSW traversal is memory-bound, so a smaller index is also a faster one.
+-- Inserts are unchanged: pgvector casts float arrays to halfvec.
+
+-- The vector_cosine_ops index can't survive the type change, drop it first
+drop index if exists idx_chunks_embedding_hnsw;
+
+alter table document_chunks
+  alter column embedding type halfvec(768)
+  using embedding::halfvec(768);
+
+set maintenance_work_mem = '2GB';
+set max_parallel_maintenance_workers = 7;
+
+create index if not exists idx_chunks_embedding_hnsw
+  on document_chunks
+  using hnsw (embedding halfvec_cosine_ops)
+  with (m = 24, ef_construction = 128);
+
+reset maintenance_work_mem;
+reset max_parallel_maintenance_workers;
+
+-- match_document: same shape as 003, with halfvec query and result types
+drop function if exists match_document(vector, int, jsonb);
+
+create or replace function match_document(
+  query_embedding halfvec(768),
+  match_count int default null,
+  filter jsonb default '{}'
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  embedding halfvec(768),
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- Transaction-local, so it only affects this search
+  perform set_config('hnsw.ef_search', '100', true);
+
+  return query
+  select
+    document_chunks.id,
+    document_chunks.chunk_text as content,
+    document_chunks.metadata,
+    document_chunks.embedding,
+    1 - (document_chunks.embedding <=> query_embedding) as similarity
+  from document_chunks
+  where document_chunks.metadata @> filter
+  order by document_chunks.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
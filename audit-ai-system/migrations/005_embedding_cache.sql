@@ -0,0 +1,12 @@
+-- Persistent chunk embedding cache, keyed by SHA-256 of the chunk text.
+-- process_all_pdfs looks chunks up here before calling Gemini, so re-uploaded
+-- or duplicated content is not embedded twice. Hashes are stored as hex text
+-- because PostgREST filters (content_hash=in.(...)) work on text values.
+
+create table if not exists embedding_cache (
+  content_hash text not null,
+  model text not null,
+  embedding halfvec(768) not null,
+  created_at timestamptz not null default now(),
+  primary key (content_hash, model)
+);
@@ -0,0 +1,44 @@
+-- match_document_multi: top-k chunks for several query embeddings in one call.
+-- Each query runs its own ORDER BY <=> LIMIT in a lateral subquery, so every
+-- query is still served by the HNSW index, but the client makes one round-trip.
+-- Embeddings arrive as a JSON array of float arrays (what PostgREST sends),
+-- and query_index is each query's 0-based position in that array.
+
+create or replace function match_document_multi(
+  query_embeddings jsonb,
+  match_count int default 3
+)
+returns table (
+  query_index int,
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- Transaction-local, so it only affects this search
+  perform set_config('hnsw.ef_search', '100', true);
+
+  return query
+  select
+    (q.ord - 1)::int,
+    m.id,
+    m.content,
+    m.metadata,
+    m.similarity
+  from jsonb_array_elements(query_embeddings) with ordinality as q(vec, ord)
+  cross join lateral (
+    select
+      dc.id,
+      dc.chunk_text as content,
+      dc.metadata,
+      1 - (dc.embedding <=> (q.vec::text)::halfvec(768)) as similarity
+    from document_chunks dc
+    order by dc.embedding <=> (q.vec::text)::halfvec(768)
+    limit match_count
+  ) m
+  order by 1, 5 desc;
+end;
+$$;
@@ -0,0 +1,40 @@
+-- Junction table for evidence file <-> anomaly links, so per-anomaly evidence
+-- lookups are a primary-key range scan instead of an @> scan of
+-- evidence_files.linked_anomaly_ids. The array column stays the source of
+-- truth for writers; a trigger mirrors it into the junction table.
+
+create table if not exists evidence_anomaly_links (
+  file_id text not null references evidence_files(file_id) on delete cascade,
+  anomaly_id text not null,
+  primary key (anomaly_id, file_id)
+);
+
+-- Backfill from existing rows
+insert into evidence_anomaly_links (file_id, anomaly_id)
+select file_id, unnest(linked_anomaly_ids)
+from evidence_files
+where linked_anomaly_ids is not null
+on conflict do nothing;
+
+create or replace function sync_evidence_anomaly_links()
+returns trigger
+language plpgsql
+as $$
+begin
+  delete from evidence_anomaly_links
+  where file_id = new.file_id
+    and anomaly_id <> all(coalesce(new.linked_anomaly_ids, '{}'));
+
+  insert into evidence_anomaly_links (file_id, anomaly_id)
+  select new.file_id, unnest(coalesce(new.linked_anomaly_ids, '{}'))
+  on conflict do nothing;
+
+  return new;
+end;
+$$;
+
+drop trigger if exists trg_sync_evidence_anomaly_links on evidence_files;
+
+create trigger trg_sync_evidence_anomaly_links
+  after insert or update of linked_anomaly_ids on evidence_files
+  for each row execute function sync_evidence_anomaly_links();
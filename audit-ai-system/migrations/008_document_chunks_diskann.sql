@@ -0,0 +1,93 @@
+-- Switch document_chunks to a pgvectorscale StreamingDiskANN index once the
+-- table is large enough for HNSW build time and RAM to dominate. Below the
+-- threshold the HNSW index from 004 is kept and nothing changes.
+--
+-- diskann indexes vector, not halfvec, so the index is built on
+-- embedding::vector(768) and match_document / match_document_multi order by
+-- the same expression for the planner to use it.
+
+do $$
+declare
+  chunk_count bigint;
+begin
+  select count(*) into chunk_count from document_chunks;
+
+  if chunk_count < 1000000 then
+    raise notice 'document_chunks has % rows, keeping HNSW index', chunk_count;
+    return;
+  end if;
+
+  create extension if not exists vectorscale cascade;
+
+  drop index if exists idx_chunks_embedding_hnsw;
+
+  create index if not exists idx_chunks_embedding_diskann
+    on document_chunks
+    using diskann ((embedding::vector(768)) vector_cosine_ops);
+
+  create or replace function match_document(
+    query_embedding halfvec(768),
+    match_count int default null,
+    filter jsonb default '{}'
+  )
+  returns table (
+    id uuid,
+    content text,
+    metadata jsonb,
+    embedding halfvec(768),
+    similarity float
+  )
+  language plpgsql
+  as $fn$
+  begin
+    return query
+    select
+      document_chunks.id,
+      document_chunks.chunk_text as content,
+      document_chunks.metadata,
+      document_chunks.embedding,
+      1 - (document_chunks.embedding::vector(768) <=> query_embedding::vector(768)) as similarity
+    from document_chunks
+    where document_chunks.metadata @> filter
+    order by document_chunks.embedding::vector(768) <=> query_embedding::vector(768)
+    limit match_count;
+  end;
+  $fn$;
+
+  create or replace function match_document_multi(
+    query_embeddings jsonb,
+    match_count int default 3
+  )
+  returns table (
+    query_index int,
+    id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+  )
+  language plpgsql
+  as $fn$
+  begin
+    return query
+    select
+      (q.ord - 1)::int,
+      m.id,
+      m.content,
+      m.metadata,
+      m.similarity
+    from jsonb_array_elements(query_embeddings) with ordinality as q(vec, ord)
+    cross join lateral (
+      select
+        dc.id,
+        dc.chunk_text as content,
+        dc.metadata,
+        1 - (dc.embedding::vector(768) <=> (q.vec::text)::vector(768)) as similarity
+      from document_chunks dc
+      order by dc.embedding::vector(768) <=> (q.vec::text)::vector(768)
+      limit match_count
+    ) m
+    order by 1, 5 desc;
+  end;
+  $fn$;
+end;
+$$;
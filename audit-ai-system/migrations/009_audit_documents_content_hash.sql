@@ -0,0 +1,33 @@
+-- Content hash for uploaded PDFs, so a document whose bytes match an already
+-- processed one gets its chunks copied server-side instead of being parsed,
+-- split and embedded again.
+
+alter table audit_documents add column if not exists content_sha256 text;
+
+create index if not exists idx_audit_documents_content_sha256
+  on audit_documents (content_sha256);
+
+-- Copy src_id's chunks to dst_id, pointing each chunk's source metadata at
+-- the destination filename. Returns the number of chunks copied.
+create or replace function clone_chunks(src_id uuid, dst_id uuid)
+returns int
+language plpgsql
+as $$
+declare
+  copied int;
+begin
+  insert into document_chunks (document_id, chunk_text, chunk_index, embedding, metadata)
+  select
+    dst_id,
+    c.chunk_text,
+    c.chunk_index,
+    c.embedding,
+    c.metadata || jsonb_build_object('source', d.filename)
+  from document_chunks c
+  cross join (select filename from audit_documents where id = dst_id) d
+  where c.document_id = src_id;
+
+  get diagnostics copied = row_count;
+  return copied;
+end;
+$$;
@@ -0,0 +1,37 @@
+-- risk_counts_for_patterns: anomaly counts per (pattern, risk, status), where
+-- an anomaly belongs to a pattern if its reasoning contains any of the
+-- pattern's keywords (case-insensitive substring match, as the Python scans
+-- did). Replaces downloading the whole anomalies table for keyword sweeps.
+--
+-- patterns: {"<pattern_key>": ["keyword", ...], ...}
+
+create extension if not exists pg_trgm;
+
+-- Trigram index so the ILIKE '%keyword%' matches don't scan every row
+create index if not exists idx_anomalies_reasoning_trgm
+  on anomalies using gin (reasoning gin_trgm_ops);
+
+create or replace function risk_counts_for_patterns(patterns jsonb)
+returns table (
+  pattern_key text,
+  risk text,
+  status text,
+  anomaly_count bigint
+)
+language sql
+stable
+as $$
+  select
+    p.key,
+    a.risk::text,
+    a.status::text,
+    count(*)
+  from jsonb_each(patterns) as p(key, keywords)
+  join anomalies a
+    on a.reasoning ilike any (
+      -- Escape LIKE wildcards so keywords match literally
+      select '%' || replace(replace(replace(kw, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+      from jsonb_array_elements_text(p.keywords) as kw
+    )
+  group by p.key, a.risk, a.status;
+$$;
@@ -0,0 +1,13 @@
+-- Atomically bump a report's download counter and return the new value.
+-- Replaces the read-modify-write in increment_download_count, which took two
+-- round-trips and could lose updates under concurrent downloads.
+
+create or replace function increment_report_downloads(p_report_id text)
+returns int
+language sql
+as $$
+  update generated_reports
+  set download_count = coalesce(download_count, 0) + 1
+  where report_id = p_report_id
+  returning download_count;
+$$;
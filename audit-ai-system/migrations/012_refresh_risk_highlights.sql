@@ -0,0 +1,21 @@
+-- Replace the current risk highlights with a new set in one transaction.
+-- payload: JSON array of {highlight_text, category, severity, is_active}.
+-- Readers never see an empty table between the delete and the inserts.
+
+create or replace function refresh_risk_highlights(payload jsonb)
+returns int
+language plpgsql
+as $$
+declare
+  inserted int;
+begin
+  delete from risk_highlights where id <> 0;
+
+  insert into risk_highlights (highlight_text, category, severity, is_active)
+  select highlight_text, category, severity, is_active
+  from jsonb_populate_recordset(null::risk_highlights, payload);
+
+  get diagnostics inserted = row_count;
+  return inserted;
+end;
+$$;
@@ -0,0 +1,122 @@
+-- Vendor and department risk aggregates computed in Postgres.
+-- The materialized views hold the weighted anomaly counts; the refresh
+-- functions rebuild them and write scores and levels back to vendor_risk /
+-- department_risk in a single UPDATE. Weights and level thresholds are the
+-- same ones calculate_vendor_risks / calculate_department_risks used.
+--
+-- Only a materialized view's owner may refresh it, so the refresh functions
+-- run as their (migration-owner) definer. They are callable by service_role
+-- only, not by anon / authenticated API clients.
+
+-- Which processes each department owns (was dept_map in Python)
+create table if not exists department_processes (
+  department_code text not null,
+  process text not null,
+  primary key (department_code, process)
+);
+
+insert into department_processes (department_code, process) values
+  ('IT', 'IT Change'),
+  ('FINANCE', 'Procure-to-Pay'),
+  ('FINANCE', 'Record-to-Report'),
+  ('OPS', 'Order-to-Cash'),
+  ('PLANT', 'Order-to-Cash'),
+  ('HR', 'Record-to-Report'),
+  ('SALES', 'Order-to-Cash'),
+  ('LEGAL', 'Risk & Compliance'),
+  ('QA', 'Record-to-Report'),
+  ('SUPPLY', 'Procure-to-Pay')
+on conflict do nothing;
+
+-- Anomalies mentioning a vendor's code or name in their reasoning
+create materialized view if not exists vendor_risk_calc as
+select
+  v.vendor_code,
+  coalesce(sum(
+    case a.risk when 'Critical' then 25 when 'High' then 15 when 'Medium' then 8 else 3 end
+  ) filter (where a.id is not null), 0) as risk_score,
+  count(a.id) filter (where a.risk = 'Critical') as critical_count,
+  count(a.id) filter (where a.risk = 'High') as high_count
+from vendor_risk v
+left join anomalies a
+  on a.reasoning ilike '%' || replace(replace(replace(v.vendor_code, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+  or a.reasoning ilike '%' || replace(replace(replace(v.vendor_name, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+group by v.vendor_code;
+
+-- Anomalies in each department's processes
+create materialized view if not exists department_risk_calc as
+select
+  dp.department_code,
+  coalesce(sum(
+    case a.risk when 'Critical' then 20 when 'High' then 12 when 'Medium' then 6 else 2 end
+  ) filter (where a.id is not null), 0) as risk_score,
+  count(a.id) filter (where a.status in ('Open', 'In Progress')) as open_findings,
+  count(a.id) filter (where a.risk = 'Critical') as critical_issues
+from department_processes dp
+left join anomalies a on a.process = dp.process
+group by dp.department_code;
+
+create or replace function refresh_vendor_risks()
+returns int
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  updated int;
+begin
+  refresh materialized view vendor_risk_calc;
+
+  update vendor_risk v
+  set
+    risk_score = least(c.risk_score, 100),
+    risk_level = case
+      when c.risk_score >= 75 or c.critical_count > 0 then 'Critical'
+      when c.risk_score >= 50 or c.high_count >= 2 then 'High'
+      when c.risk_score >= 30 then 'Medium'
+      else 'Low'
+    end,
+    last_assessment = now()
+  from vendor_risk_calc c
+  where c.vendor_code = v.vendor_code;
+
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+
+create or replace function refresh_department_risks()
+returns int
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  updated int;
+begin
+  refresh materialized view department_risk_calc;
+
+  update department_risk d
+  set
+    risk_score = least(c.risk_score, 100),
+    risk_level = case
+      when c.critical_issues >= 3 or c.risk_score >= 80 then 'Critical'
+      when c.critical_issues >= 1 or c.risk_score >= 60 then 'High'
+      when c.risk_score >= 35 then 'Medium'
+      else 'Low'
+    end,
+    open_findings = c.open_findings,
+    critical_issues = c.critical_issues,
+    last_assessment = now()
+  from department_risk_calc c
+  where c.department_code = d.department_code;
+
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+
+revoke execute on function refresh_vendor_risks() from public, anon, authenticated;
+revoke execute on function refresh_department_risks() from public, anon, authenticated;
+grant execute on function refresh_vendor_risks() to service_role;
+grant execute on function refresh_department_risks() to service_role;
@@ -0,0 +1,47 @@
+-- risk_counts_for_patterns, now also returning top_ids: the 20 most recently
+-- detected anomaly IDs per pattern (repeated on each of the pattern's rows).
+-- Lets risk clusters take their anomaly_ids from the database instead of
+-- re-scanning every anomaly's reasoning in Python.
+--
+-- The return type changes, so the function has to be dropped first.
+
+drop function if exists risk_counts_for_patterns(jsonb);
+
+create function risk_counts_for_patterns(patterns jsonb)
+returns table (
+  pattern_key text,
+  risk text,
+  status text,
+  anomaly_count bigint,
+  top_ids text[]
+)
+language sql
+stable
+as $$
+  with matches as (
+    select p.key as pattern_key, a.id, a.risk, a.status, a.detected_at
+    from jsonb_each(patterns) as p(key, keywords)
+    join anomalies a
+      on a.reasoning ilike any (
+        -- Escape LIKE wildcards so keywords match literally
+        select '%' || replace(replace(replace(kw, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+        from jsonb_array_elements_text(p.keywords) as kw
+      )
+  ),
+  top as (
+    select
+      pattern_key,
+      (array_agg(id::text order by detected_at desc nulls last))[1:20] as top_ids
+    from matches
+    group by pattern_key
+  )
+  select
+    m.pattern_key,
+    m.risk::text,
+    m.status::text,
+    count(*),
+    t.top_ids
+  from matches m
+  join top t using (pattern_key)
+  group by m.pattern_key, m.risk, m.status, t.top_ids;
+$$;
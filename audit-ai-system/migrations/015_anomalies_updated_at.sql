@@ -0,0 +1,42 @@
+-- Change signal for the risk calculation short-circuit: anomalies.updated_at,
+-- set on insert and bumped by a trigger only when a column the risk
+-- calculations read (risk, status, process, reasoning) actually changes, so
+-- agents re-upserting the same findings with a fresh detected_at don't move
+-- it. anomalies_change_marker() returns it together with the row count so
+-- deletions are noticed too.
+
+alter table anomalies
+  add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists idx_anomalies_updated_at
+  on anomalies (updated_at);
+
+create or replace function touch_anomalies_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at := now();
+  return new;
+end;
+$$;
+
+drop trigger if exists trg_touch_anomalies_updated_at on anomalies;
+
+create trigger trg_touch_anomalies_updated_at
+  before update on anomalies
+  for each row
+  when ((old.risk, old.status, old.process, old.reasoning)
+        is distinct from (new.risk, new.status, new.process, new.reasoning))
+  execute function touch_anomalies_updated_at();
+
+create or replace function anomalies_change_marker()
+returns table (
+  last_updated timestamptz,
+  anomaly_count bigint
+)
+language sql
+stable
+as $$
+  select max(updated_at), count(*) from anomalies;
+$$;
@@ -21,6 +21,12 @@ class AgentStatus(BaseModel):
     last_scan: Optional[str] = None
 
 
+class DuplicateFinding(BaseModel):
+    found: bool
+    amount: Optional[str] = None
+    details: Optional[str] = None
+
+
 class ExplainRequest(BaseModel):
     finding_title: str
 
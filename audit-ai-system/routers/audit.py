@@ -3,7 +3,7 @@ from io import BytesIO
 from fastapi import APIRouter, HTTPException
 from services.pdf_processor import process_all_pdfs
 from services.audit_analyzer import extract_audit_metrics, extract_risk_heatmap, extract_findings
-from services.report_generator import generate_executive_summary
+from services.report_generator import generate_executive_summary, stream_executive_summary
 from supabase_client import supabase
 from models.schemas import DashboardResponse
 # Add this import
@@ -53,7 +53,8 @@ from services.reports_evidence_service import (
     link_evidence_to_anomaly,
     sync_evidence_from_anomalies,
     get_all_reports,
-    create_report_metadata
+    create_report_metadata,
+    increment_download_count
 )
 
 from services.alerts_service import (
@@ -159,6 +160,22 @@ async def generate_report():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/report/generate/stream")
+async def generate_report_stream():
+    """Stream the executive summary report text as it is generated"""
+    try:
+        chunks = await stream_executive_summary()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        chunks,
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 @router.post("/exploration/generate")
 async def generate_exploration_data():
     """
@@ -466,6 +483,18 @@ async def create_report(report_data: dict):
         return {"status": "success", "report": report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/reports-evidence/reports/{report_id}/download")
+async def record_report_download(report_id: str):
+    """Record a report download, returning the new download count"""
+    try:
+        download_count = await increment_download_count(report_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if download_count is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return {"report_id": report_id, "download_count": download_count}
     
 # Add this endpoint
 @router.post("/reports-evidence/generate/{report_type}")
@@ -45,7 +45,7 @@ async def generate_anomalies_from_agents():
         
         # ✨ NEW: Auto-calculate risk scores after anomalies are generated
         print("Calculating risk scores...")
-        await calculate_and_update_all_risks()
+        await calculate_and_update_all_risks(skip_if_unchanged=True)
         print("✓ Risk scores updated")
         
         return {
@@ -46,8 +46,8 @@ class ComplianceCheckerAgent:
             
             result = supabase.rpc(
                 'match_document',
-                {'query_embedding': query_embedding}
-            ).limit(k).execute()
+                {'query_embedding': query_embedding, 'match_count': k}
+            ).execute()
             
             if result.data:
                 docs = []
@@ -1,19 +1,72 @@
 """
 Finance Auditor Agent - Autonomous financial audit monitoring (FIXED)
 """
-from langchain_google_genai import ChatGoogleGenerativeAI
-from supabase_client import supabase
-from config import settings
-from services.rag_assistant import get_embeddings
-import json
-from datetime import datetime
+import db
+from services import semantic_cache
+from services.llm_batcher import explain_batcher
+from services.rag_assistant import (
+    get_embeddings,
+    get_shared_llm,
+    embed_triggers,
+    build_search_result,
+    docs_match_triggers
+)
+from models.agent_models import DuplicateFinding
+from langchain.prompts import ChatPromptTemplate
+from datetime import datetime, timezone
+import time
+import logging
+from functools import cache
+import re
 import asyncio
 
+log = logging.getLogger(__name__)
+
+# Confidence indexed by number of findings (0, 1, 2, 3+)
+_CONFIDENCE_BY_FINDINGS = (0.95, 0.93, 0.93, 0.87)
+
+
+DUPLICATE_PROMPT = ChatPromptTemplate.from_template(
+    """Extract duplicate invoice information from this audit text:
+
+{context}
+
+Set found to true only if duplicate invoices are mentioned. When found, give the
+amount in thousands (e.g. "50") and a brief description in details."""
+)
+
 
 class FinanceAuditorAgent:
     """Specialized AI agent for financial audit monitoring"""
-    _embeddings = None
-    _llm = None
+
+    # Reference phrases each detector compares retrieved chunks against
+    TRIGGERS = {
+        "three_way": [
+            "3-way match missing PO",
+            "invoice paid without purchase order or goods receipt",
+        ],
+        "round_dollar": [
+            "round-dollar approval pattern",
+            "suspicious round dollar amounts approved",
+        ],
+    }
+
+    # Retrieval query issued by each detector during a scan
+    SCAN_QUERIES = {
+        "duplicates": "duplicate invoices payments same vendor",
+        "three_way": "3-way match purchase order invoice receipt missing",
+        "round_dollar": "round dollar amounts suspicious approvals fraud",
+    }
+
+    # Keyword fallbacks: every group must appear somewhere in the context, in any order
+    _THREE_WAY_TRIGGER = re.compile(
+        r'(?=.*?(?:3-way|three-way|three way))(?=.*?(?:missing|lack|without))',
+        re.IGNORECASE | re.DOTALL
+    )
+    _ROUND_DOLLAR_TRIGGER = re.compile(
+        r'(?=.*?(?:round))(?=.*?(?:dollar))',
+        re.IGNORECASE | re.DOTALL
+    )
     
     def __init__(self):
         self.status = "idle"
@@ -21,67 +74,86 @@ class FinanceAuditorAgent:
         self.findings = []
         self.last_scan = None
         self.domain = "finance"
+        self._trigger_embeddings = None
+        self._duplicate_chain = None
+        self._status_cache = None
+        self._refresh_status()
 
     def get_embeddings(self):
         """Get embeddings model (lazy load)"""
-        if FinanceAuditorAgent._embeddings is None:
-            FinanceAuditorAgent._embeddings = get_embeddings()
-        return FinanceAuditorAgent._embeddings
+        return get_embeddings()
 
     def get_llm(self, temperature=0.3):
         """Get LLM (lazy load)"""
-        if FinanceAuditorAgent._llm is None:
-            FinanceAuditorAgent._llm = ChatGoogleGenerativeAI(
-                model=settings.GEMINI_MODEL,
-                temperature=temperature,
-                google_api_key=settings.GOOGLE_API_KEY
-            )
-        return FinanceAuditorAgent._llm
+        return get_shared_llm(temperature)
 
-    async def _search_documents(self, query: str, k: int = 3):
-        """Search documents using direct Supabase RPC call"""
+    def get_duplicate_chain(self):
+        """Get structured-output chain for duplicate invoice extraction (lazy load)"""
+        if self._duplicate_chain is None:
+            llm = self.get_llm(temperature=0)
+            self._duplicate_chain = DUPLICATE_PROMPT | llm.with_structured_output(DuplicateFinding)
+        return self._duplicate_chain
+
+    async def get_trigger_embeddings(self):
+        """Get normalized trigger phrase embeddings (lazy load, embedded off the event loop)"""
+        if self._trigger_embeddings is None:
+            self._trigger_embeddings = await asyncio.to_thread(embed_triggers, self.TRIGGERS)
+        return self._trigger_embeddings
+
+    async def _embed_scan_queries(self):
+        """Embed all scan queries in one batched request"""
+        embeddings_model = self.get_embeddings()
+        vectors = await asyncio.to_thread(
+            embeddings_model.embed_documents,
+            list(self.SCAN_QUERIES.values()),
+            task_type="retrieval_query"
+        )
+        return dict(zip(self.SCAN_QUERIES, vectors))
+
+    async def _search_documents(self, query: str, k: int = 3, query_embedding=None):
+        """Search documents with a direct match_document query"""
         try:
             # Generate embedding for the query
-            embeddings_model = self.get_embeddings()
-            query_embedding = embeddings_model.embed_query(query)
-            
-            # Call Supabase RPC function directly
-            result = supabase.rpc(
-                'match_document',
-                {
-                    'query_embedding': query_embedding
-                }
-            ).limit(k).execute()
-            
-            if result.data:
-                # Convert to document-like objects
-                docs = []
-                for item in result.data:
-                    docs.append({
-                        'content': item.get('content', ''),
-                        'metadata': item.get('metadata', {}),
-                        'similarity': item.get('similarity', 0)
-                    })
+            if query_embedding is None:
+                embeddings_model = self.get_embeddings()
+                query_embedding = await asyncio.to_thread(embeddings_model.embed_query, query)
+
+            cached = semantic_cache.get(query_embedding, k)
+            if cached is not None:
+                return cached
+            
+            # Query Postgres directly over the asyncpg pool, bypassing PostgREST
+            rows = await db.match_document(query_embedding, k)
+            
+            if rows:
+                docs = build_search_result(rows)
+                semantic_cache.put(query_embedding, k, docs)
                 return docs
             
-            return []
+            return build_search_result([])
             
-        except Exception as e:
-            print(f"Error searching documents: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+        except Exception:
+            log.exception("Error searching documents")
+            return build_search_result([])
 
     async def scan(self):
         """Run autonomous financial audit scan"""
         self.status = "scanning"
-        print(f"[Finance Auditor] Starting scan at {datetime.now()}")
+        self._refresh_status()
+        log.info("Starting scan")
+        started = time.monotonic()
         
         try:
+            # Embed every detector query in one request, alongside the trigger phrases on first scan
+            query_embeddings, _ = await asyncio.gather(
+                self._embed_scan_queries(),
+                self.get_trigger_embeddings()
+            )
+
             # Run all checks
-            duplicates = await self._detect_duplicate_invoices()
-            three_way_issues = await self._check_three_way_match()
-            round_dollar = await self._detect_round_dollar_approvals()
+            duplicates = await self._detect_duplicate_invoices(query_embeddings["duplicates"])
+            three_way_issues = await self._check_three_way_match(query_embeddings["three_way"])
+            round_dollar = await self._detect_round_dollar_approvals(query_embeddings["round_dollar"])
 
             # Compile findings
             self.findings = []
@@ -109,183 +181,141 @@ class FinanceAuditorAgent:
             # Calculate confidence
             self.confidence = self._calculate_confidence()
             self.status = "active"
-            self.last_scan = datetime.now().isoformat()
+            self.last_scan = time.time()
+            self._refresh_status()
             
-            print(f"[Finance Auditor] Scan complete. Found {len(self.findings)} issues")
+            log.info("Scan complete in %.2fs. Found %d issues", time.monotonic() - started, len(self.findings))
             
             return {
                 "status": self.status,
                 "confidence": self.confidence,
                 "findings": self.findings,
-                "last_scan": self.last_scan
+                "last_scan": self._status_cache["last_scan"]
             }
             
         except Exception as e:
-            print(f"[Finance Auditor] Error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Scan failed")
             self.status = "error"
+            self._refresh_status()
             return {
                 "status": "error",
                 "error": str(e)
             }
 
-    async def _detect_duplicate_invoices(self):
+    async def _detect_duplicate_invoices(self, query_embedding=None):
         """Query for duplicate invoice patterns"""
         try:
             docs = await self._search_documents(
-                "duplicate invoices payments same vendor",
-                k=3
+                self.SCAN_QUERIES["duplicates"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[Finance Auditor] No documents found for duplicate invoices")
+            if not docs['contents']:
+                log.debug("No documents found for duplicate invoices")
                 return None
             
-            print(f"[Finance Auditor] Found {len(docs)} documents for duplicate analysis")
+            log.debug("Found %d documents for duplicate analysis", len(docs['contents']))
             
-            llm = self.get_llm(temperature=0)
-            context = "\n".join([doc['content'] for doc in docs])
+            context = "\n".join(docs['contents'])
             
             # Check if context is meaningful
             if len(context.strip()) < 50:
-                print("[Finance Auditor] Context too short, skipping duplicate detection")
+                log.debug("Context too short, skipping duplicate detection")
                 return None
             
-            print(f"[Finance Auditor] Context length: {len(context)} chars")
+            log.debug("Context length: %d chars", len(context))
             
-            prompt = f"""Extract duplicate invoice information from this audit text:
-
-{context}
-
-Return ONLY valid JSON in this exact format (no markdown, no extra text):
-{{
-    "found": true,
-    "amount": "50",
-    "details": "brief description"
-}}
-
-If no duplicate invoices are mentioned, return:
-{{
-    "found": false
-}}"""
-            
-            response = llm.invoke(prompt)
-            response_text = response.content.strip()
-            
-            print(f"[Finance Auditor] LLM Response: {response_text[:200]}")
-            
-            # Clean up response
-            response_text = response_text.replace("``````", "").strip()
-            
-            # Try to parse JSON
-            try:
-                result = json.loads(response_text)
-                
-                if result.get("found"):
-                    print(f"[Finance Auditor] Duplicate found: {result}")
-                    return result
-                else:
-                    print("[Finance Auditor] No duplicates found by LLM")
-                    return None
-                    
-            except json.JSONDecodeError as je:
-                print(f"[Finance Auditor] JSON parse error: {je}")
-                print(f"[Finance Auditor] Response was: {response_text}")
-                    
-                # Fallback: Check if context mentions duplicates
-                if "duplicate" in context.lower() and "invoice" in context.lower():
-                    print("[Finance Auditor] Fallback: Found duplicate mentions in context")
-                    return {
-                        "found": True,
-                        "amount": "unknown",
-                        "details": "Duplicate invoices mentioned in audit documents"
-                    }
-                    
-                return None
+            result = await self.get_duplicate_chain().ainvoke({"context": context})
             
-        except Exception as e:
-            print(f"Error detecting duplicates: {e}")
-            import traceback
-            traceback.print_exc()
+            if result.found:
+                log.info("Duplicate found: %s", result)
+                return {
+                    "found": True,
+                    "amount": result.amount or "unknown",
+                    "details": result.details or "Duplicate invoices mentioned in audit documents"
+                }
+            
+            log.debug("No duplicates found by LLM")
+            return None
+            
+        except Exception:
+            log.exception("Error detecting duplicates")
             return None
 
-    async def _check_three_way_match(self):
+    async def _check_three_way_match(self, query_embedding=None):
         """Check for 3-way match violations"""
         try:
             docs = await self._search_documents(
-                "3-way match purchase order invoice receipt missing",
-                k=3
+                self.SCAN_QUERIES["three_way"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[Finance Auditor] No documents found for 3-way match")
+            if not docs['contents']:
+                log.debug("No documents found for 3-way match")
                 return None
             
-            print(f"[Finance Auditor] Found {len(docs)} documents for 3-way match analysis")
+            log.debug("Found %d documents for 3-way match analysis", len(docs['contents']))
             
-            # Simple keyword check in retrieved context
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["three_way"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._THREE_WAY_TRIGGER.match(context))
             
-            if "3-way" in context or "three-way" in context or "three way" in context:
-                if "missing" in context or "lack" in context or "without" in context:
-                    print("[Finance Auditor] 3-way match issues detected")
-                    return "Multiple transactions lack proper 3-way matching (PO, Invoice, Receipt)"
+            if matched:
+                log.info("3-way match issues detected")
+                return "Multiple transactions lack proper 3-way matching (PO, Invoice, Receipt)"
             
-            print("[Finance Auditor] No 3-way match issues found")
+            log.debug("No 3-way match issues found")
             return None
             
-        except Exception as e:
-            print(f"Error checking 3-way match: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("Error checking 3-way match")
             return None
 
-    async def _detect_round_dollar_approvals(self):
+    async def _detect_round_dollar_approvals(self, query_embedding=None):
         """Detect suspicious round-dollar approvals"""
         try:
             docs = await self._search_documents(
-                "round dollar amounts suspicious approvals fraud",
-                k=3
+                self.SCAN_QUERIES["round_dollar"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[Finance Auditor] No documents found for round-dollar detection")
+            if not docs['contents']:
+                log.debug("No documents found for round-dollar detection")
                 return None
             
-            print(f"[Finance Auditor] Found {len(docs)} documents for round-dollar analysis")
+            log.debug("Found %d documents for round-dollar analysis", len(docs['contents']))
             
-            # Simple keyword check
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["round_dollar"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._ROUND_DOLLAR_TRIGGER.match(context))
             
-            if ("round" in context and "dollar" in context) or "round-dollar" in context:
-                print("[Finance Auditor] Round-dollar patterns detected")
+            if matched:
+                log.info("Round-dollar patterns detected")
                 return "Pattern of round-dollar approvals detected (potential fraud indicator)"
             
-            print("[Finance Auditor] No round-dollar patterns found")
+            log.debug("No round-dollar patterns found")
             return None
             
-        except Exception as e:
-            print(f"Error detecting round-dollar: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("Error detecting round-dollar")
             return None
 
     def _calculate_confidence(self):
         """Calculate agent confidence score"""
-        if len(self.findings) == 0:
-            return 0.95
-        elif len(self.findings) <= 2:
-            return 0.93
-        else:
-            return 0.87
+        return _CONFIDENCE_BY_FINDINGS[min(len(self.findings), 3)]
 
     async def explain_finding(self, finding_title: str):
         """Generate detailed explanation for a finding"""
         try:
-            llm = self.get_llm(temperature=0.3)
             docs = await self._search_documents(finding_title, k=3)
-            context = "\n\n".join([doc['content'] for doc in docs])
+            context = "\n\n".join(docs['contents'])
             
             prompt = f"""You are a Finance Auditor AI agent. Explain this finding in detail:
 
@@ -302,37 +332,36 @@ Provide:
 
 Be specific and reference numbers/details from the context."""
             
-            response = llm.invoke(prompt)
+            response = await explain_batcher.submit(prompt)
             return response.content
             
         except Exception as e:
-            print(f"Error generating explanation: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Error generating explanation")
             return f"Error generating explanation: {str(e)}"
 
-    def get_status(self):
-        """Get current agent status"""
-        return {
+    def _refresh_status(self):
+        """Rebuild the cached status dict (call after any state change)"""
+        # last_scan is kept as a UTC epoch and only formatted here
+        last_scan = datetime.fromtimestamp(self.last_scan, tz=timezone.utc).isoformat() if self.last_scan else None
+        self._status_cache = {
             "agent": "Finance Auditor",
             "status": self.status,
             "confidence": self.confidence,
             "findings_count": len(self.findings),
             "findings": self.findings,
-            "last_scan": self.last_scan
+            "last_scan": last_scan
         }
 
-
-# Singleton agent instance
-finance_agent = None
+    def get_status(self):
+        """Get current agent status"""
+        return self._status_cache
 
 
+# Singleton agent instance
+@cache
 def get_finance_agent():
     """Get or create finance agent instance"""
-    global finance_agent
-    if finance_agent is None:
-        finance_agent = FinanceAuditorAgent()
-    return finance_agent
+    return FinanceAuditorAgent()
 
 
 async def run_finance_agent():
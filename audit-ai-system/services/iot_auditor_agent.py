@@ -1,18 +1,59 @@
 """
 IoT Auditor Agent - Autonomous Internet of Things and operational technology monitoring
 """
-from langchain_google_genai import ChatGoogleGenerativeAI
-from supabase_client import supabase
-from config import settings
-from services.rag_assistant import get_embeddings
-import json
-from datetime import datetime
+import db
+from services import semantic_cache
+from services.llm_batcher import explain_batcher
+from services.rag_assistant import (
+    get_embeddings,
+    get_shared_llm,
+    embed_triggers,
+    build_search_result,
+    docs_match_triggers
+)
+import re
+from datetime import datetime, timezone
+import time
+import logging
+from functools import cache
+import asyncio
+
+log = logging.getLogger(__name__)
+
+# Confidence indexed by number of findings (0, 1, 2, 3+)
+_CONFIDENCE_BY_FINDINGS = (0.80, 0.82, 0.82, 0.78)
 
 
 class IoTAuditorAgent:
     """Specialized AI agent for IoT/OT device anomaly detection and audit"""
-    _embeddings = None
-    _llm = None
+
+    # Reference phrases each detector compares retrieved chunks against
+    TRIGGERS = {
+        "torque": [
+            "torque variance outlier",
+            "fastening torque readings outside tolerance",
+        ],
+        "sensor_drift": [
+            "sensor drift on line 3",
+            "sensor readings drifting out of calibration",
+        ],
+    }
+
+    # Retrieval query issued by each detector during a scan
+    SCAN_QUERIES = {
+        "torque": "torque variance outlier manufacturing sensor anomaly",
+        "sensor_drift": "sensor drift line 3 anomaly manufacturing equipment",
+    }
+
+    # Keyword fallbacks: every group must appear somewhere in the context, in any order
+    _TORQUE_TRIGGER = re.compile(
+        r'(?=.*?(?:torque))(?=.*?(?:variance))',
+        re.IGNORECASE | re.DOTALL
+    )
+    _DRIFT_TRIGGER = re.compile(
+        r'(?=.*?(?:sensor))(?=.*?(?:drift))',
+        re.IGNORECASE | re.DOTALL
+    )
 
     def __init__(self):
         self.status = "idle"
@@ -20,52 +61,67 @@ class IoTAuditorAgent:
         self.findings = []
         self.last_scan = None
         self.domain = "iot"
+        self._trigger_embeddings = None
+        self._status_cache = None
+        self._refresh_status()
 
     def get_embeddings(self):
-        if IoTAuditorAgent._embeddings is None:
-            IoTAuditorAgent._embeddings = get_embeddings()
-        return IoTAuditorAgent._embeddings
+        return get_embeddings()
 
     def get_llm(self, temperature=0.3):
-        if IoTAuditorAgent._llm is None:
-            IoTAuditorAgent._llm = ChatGoogleGenerativeAI(
-                model=settings.GEMINI_MODEL,
-                temperature=temperature,
-                google_api_key=settings.GOOGLE_API_KEY
-            )
-        return IoTAuditorAgent._llm
-
-    async def _search_documents(self, query: str, k: int = 3):
+        return get_shared_llm(temperature)
+
+    async def get_trigger_embeddings(self):
+        if self._trigger_embeddings is None:
+            self._trigger_embeddings = await asyncio.to_thread(embed_triggers, self.TRIGGERS)
+        return self._trigger_embeddings
+
+    async def _embed_scan_queries(self):
+        embeddings_model = self.get_embeddings()
+        vectors = await asyncio.to_thread(
+            embeddings_model.embed_documents,
+            list(self.SCAN_QUERIES.values()),
+            task_type="retrieval_query"
+        )
+        return dict(zip(self.SCAN_QUERIES, vectors))
+
+    async def _search_documents(self, query: str, k: int = 3, query_embedding=None):
         try:
-            embeddings_model = self.get_embeddings()
-            query_embedding = embeddings_model.embed_query(query)
-
-            result = supabase.rpc(
-                'match_document',
-                {'query_embedding': query_embedding}
-            ).limit(k).execute()
-
-            if result.data:
-                docs = []
-                for item in result.data:
-                    docs.append({
-                        'content': item.get('content', ''),
-                        'metadata': item.get('metadata', {}),
-                        'similarity': item.get('similarity', 0)
-                    })
+            if query_embedding is None:
+                embeddings_model = self.get_embeddings()
+                query_embedding = await asyncio.to_thread(embeddings_model.embed_query, query)
+
+            cached = semantic_cache.get(query_embedding, k)
+            if cached is not None:
+                return cached
+
+            # Query Postgres directly over the asyncpg pool, bypassing PostgREST
+            rows = await db.match_document(query_embedding, k)
+
+            if rows:
+                docs = build_search_result(rows)
+                semantic_cache.put(query_embedding, k, docs)
                 return docs
-            return []
-        except Exception as e:
-            print(f"[IoT Auditor] Error searching documents: {e}")
-            return []
+            return build_search_result([])
+        except Exception:
+            log.exception("Error searching documents")
+            return build_search_result([])
 
     async def scan(self):
         self.status = "scanning"
-        print(f"[IoT Auditor] Starting scan at {datetime.now()}")
+        self._refresh_status()
+        log.info("Starting scan")
+        started = time.monotonic()
 
         try:
-            torque_issues = await self._detect_torque_variance()
-            sensor_drift = await self._detect_sensor_drift()
+            # Embed every detector query in one request, alongside the trigger phrases on first scan
+            query_embeddings, _ = await asyncio.gather(
+                self._embed_scan_queries(),
+                self.get_trigger_embeddings()
+            )
+
+            torque_issues = await self._detect_torque_variance(query_embeddings["torque"])
+            sensor_drift = await self._detect_sensor_drift(query_embeddings["sensor_drift"])
 
             self.findings = []
             if torque_issues:
@@ -84,77 +140,83 @@ class IoTAuditorAgent:
 
             self.confidence = self._calculate_confidence()
             self.status = "active"
-            self.last_scan = datetime.now().isoformat()
+            self.last_scan = time.time()
+            self._refresh_status()
 
-            print(f"[IoT Auditor] Scan complete. Found {len(self.findings)} issues")
+            log.info("Scan complete in %.2fs. Found %d issues", time.monotonic() - started, len(self.findings))
 
             return {
                 "status": self.status,
                 "confidence": self.confidence,
                 "findings": self.findings,
-                "last_scan": self.last_scan
+                "last_scan": self._status_cache["last_scan"]
             }
         except Exception as e:
-            print(f"[IoT Auditor] Error: {str(e)}")
+            log.exception("Scan failed")
             self.status = "error"
+            self._refresh_status()
             return {
                 "status": "error",
                 "error": str(e)
             }
 
-    async def _detect_torque_variance(self):
+    async def _detect_torque_variance(self, query_embedding=None):
         try:
             docs = await self._search_documents(
-                "torque variance outlier manufacturing sensor anomaly",
-                k=3
+                self.SCAN_QUERIES["torque"],
+                k=3,
+                query_embedding=query_embedding
             )
-            if not docs or len(docs) == 0:
-                print("[IoT Auditor] No docs found for torque variance")
+            if not docs['contents']:
+                log.debug("No docs found for torque variance")
                 return None
 
-            context = "\n".join([doc['content'].lower() for doc in docs])
-            if "torque" in context and "variance" in context:
-                print("[IoT Auditor] Torque variance issues detected")
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["torque"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._TORQUE_TRIGGER.match(context))
+            if matched:
+                log.info("Torque variance issues detected")
                 return "Detected torque variance outlier in manufacturing equipment"
 
             return None
-        except Exception as e:
-            print(f"[IoT Auditor] Error detecting torque variance: {e}")
+        except Exception:
+            log.exception("Error detecting torque variance")
             return None
 
-    async def _detect_sensor_drift(self):
+    async def _detect_sensor_drift(self, query_embedding=None):
         try:
             docs = await self._search_documents(
-                "sensor drift line 3 anomaly manufacturing equipment",
-                k=3
+                self.SCAN_QUERIES["sensor_drift"],
+                k=3,
+                query_embedding=query_embedding
             )
-            if not docs or len(docs) == 0:
-                print("[IoT Auditor] No docs found for sensor drift")
+            if not docs['contents']:
+                log.debug("No docs found for sensor drift")
                 return None
 
-            context = "\n".join([doc['content'].lower() for doc in docs])
-            if "sensor" in context and "drift" in context:
-                print("[IoT Auditor] Sensor drift detected")
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["sensor_drift"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._DRIFT_TRIGGER.match(context))
+            if matched:
+                log.info("Sensor drift detected")
                 return "Line 3 sensor drift detected indicating calibration issues"
 
             return None
-        except Exception as e:
-            print(f"[IoT Auditor] Error detecting sensor drift: {e}")
+        except Exception:
+            log.exception("Error detecting sensor drift")
             return None
 
     def _calculate_confidence(self):
-        if len(self.findings) == 0:
-            return 0.80
-        elif len(self.findings) <= 2:
-            return 0.82
-        else:
-            return 0.78
+        return _CONFIDENCE_BY_FINDINGS[min(len(self.findings), 3)]
 
     async def explain_finding(self, finding_title: str):
         try:
-            llm = self.get_llm(temperature=0.3)
             docs = await self._search_documents(finding_title, k=3)
-            context = "\n\n".join([doc['content'] for doc in docs])
+            context = "\n\n".join(docs['contents'])
 
             prompt = f"""You are an IoT Auditor AI agent. Explain this IoT finding in detail:
 
@@ -170,30 +232,31 @@ Provide:
 4. Recommended actions for remediation
 
 Be specific and reference details from the context."""
-            response = llm.invoke(prompt)
+            response = await explain_batcher.submit(prompt)
             return response.content
         except Exception as e:
-            print(f"[IoT Auditor] Error generating explanation: {e}")
+            log.exception("Error generating explanation")
             return f"Error generating explanation: {str(e)}"
 
-    def get_status(self):
-        return {
+    def _refresh_status(self):
+        # last_scan is kept as a UTC epoch and only formatted here
+        last_scan = datetime.fromtimestamp(self.last_scan, tz=timezone.utc).isoformat() if self.last_scan else None
+        self._status_cache = {
             "agent": "IoT Auditor",
             "status": self.status,
             "confidence": self.confidence,
             "findings_count": len(self.findings),
             "findings": self.findings,
-            "last_scan": self.last_scan
+            "last_scan": last_scan
         }
 
-# Singleton agent instance
-iot_agent = None
+    def get_status(self):
+        return self._status_cache
 
+# Singleton agent instance
+@cache
 def get_iot_agent():
-    global iot_agent
-    if iot_agent is None:
-        iot_agent = IoTAuditorAgent()
-    return iot_agent
+    return IoTAuditorAgent()
 
 async def run_iot_agent():
     agent = get_iot_agent()
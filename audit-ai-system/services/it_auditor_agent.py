@@ -1,19 +1,68 @@
 """
 IT Auditor Agent - Autonomous IT controls and security monitoring
 """
-from langchain_google_genai import ChatGoogleGenerativeAI
-from supabase_client import supabase
-from config import settings
-from services.rag_assistant import get_embeddings
-import json
-from datetime import datetime
+import db
+from services import semantic_cache
+from services.llm_batcher import explain_batcher
+from services.rag_assistant import (
+    get_embeddings,
+    get_shared_llm,
+    embed_triggers,
+    build_search_result,
+    docs_match_triggers
+)
+import re
+from datetime import datetime, timezone
+import time
+import logging
+from functools import cache
 import asyncio
 
+log = logging.getLogger(__name__)
+
+# Confidence indexed by number of findings (0, 1, 2, 3+)
+_CONFIDENCE_BY_FINDINGS = (0.94, 0.91, 0.91, 0.87)
+
 
 class ITAuditorAgent:
     """Specialized AI agent for IT audit and security monitoring"""
-    _embeddings = None
-    _llm = None
+
+    # Reference phrases each detector compares retrieved chunks against
+    TRIGGERS = {
+        "cab": [
+            "production change deployed without CAB approval",
+            "change advisory board process bypassed",
+        ],
+        "sod": [
+            "segregation of duties violation",
+            "same user can create and approve payments",
+        ],
+        "admin_rights": [
+            "excessive administrator privileges",
+            "users with unnecessary admin rights",
+        ],
+    }
+
+    # Retrieval query issued by each detector during a scan
+    SCAN_QUERIES = {
+        "cab": "CAB production change approval PRD deployment change advisory board",
+        "sod": "segregation of duties SoD conflict same user permissions access control",
+        "admin_rights": "admin rights administrator privileges superuser excessive permissions",
+    }
+
+    # Keyword fallbacks: every group must appear somewhere in the context, in any order
+    _CAB_TRIGGER = re.compile(
+        r'(?=.*?(?:cab|change advisory|production))(?=.*?(?:without|bypass|missing))',
+        re.IGNORECASE | re.DOTALL
+    )
+    _SOD_TRIGGER = re.compile(
+        r'(?=.*?(?:segregation|sod|conflict))(?=.*?(?:violation|same user|dual))',
+        re.IGNORECASE | re.DOTALL
+    )
+    _ADMIN_TRIGGER = re.compile(
+        r'(?=.*?(?:admin|administrator|privilege))(?=.*?(?:excessive|too many|unnecessary))',
+        re.IGNORECASE | re.DOTALL
+    )
     
     def __init__(self):
         self.status = "idle"
@@ -21,60 +70,77 @@ class ITAuditorAgent:
         self.findings = []
         self.last_scan = None
         self.domain = "it"
+        self._trigger_embeddings = None
+        self._status_cache = None
+        self._refresh_status()
 
     def get_embeddings(self):
         """Get embeddings model (lazy load)"""
-        if ITAuditorAgent._embeddings is None:
-            ITAuditorAgent._embeddings = get_embeddings()
-        return ITAuditorAgent._embeddings
+        return get_embeddings()
 
     def get_llm(self, temperature=0.3):
         """Get LLM (lazy load)"""
-        if ITAuditorAgent._llm is None:
-            ITAuditorAgent._llm = ChatGoogleGenerativeAI(
-                model=settings.GEMINI_MODEL,
-                temperature=temperature,
-                google_api_key=settings.GOOGLE_API_KEY
-            )
-        return ITAuditorAgent._llm
+        return get_shared_llm(temperature)
 
-    async def _search_documents(self, query: str, k: int = 3):
-        """Search documents using direct Supabase RPC call"""
+    async def get_trigger_embeddings(self):
+        """Get normalized trigger phrase embeddings (lazy load, embedded off the event loop)"""
+        if self._trigger_embeddings is None:
+            self._trigger_embeddings = await asyncio.to_thread(embed_triggers, self.TRIGGERS)
+        return self._trigger_embeddings
+
+    async def _embed_scan_queries(self):
+        """Embed all scan queries in one batched request"""
+        embeddings_model = self.get_embeddings()
+        vectors = await asyncio.to_thread(
+            embeddings_model.embed_documents,
+            list(self.SCAN_QUERIES.values()),
+            task_type="retrieval_query"
+        )
+        return dict(zip(self.SCAN_QUERIES, vectors))
+
+    async def _search_documents(self, query: str, k: int = 3, query_embedding=None):
+        """Search documents with a direct match_document query"""
         try:
-            embeddings_model = self.get_embeddings()
-            query_embedding = embeddings_model.embed_query(query)
+            if query_embedding is None:
+                embeddings_model = self.get_embeddings()
+                query_embedding = await asyncio.to_thread(embeddings_model.embed_query, query)
+
+            cached = semantic_cache.get(query_embedding, k)
+            if cached is not None:
+                return cached
             
-            result = supabase.rpc(
-                'match_document',
-                {'query_embedding': query_embedding}
-            ).limit(k).execute()
+            # Query Postgres directly over the asyncpg pool, bypassing PostgREST
+            rows = await db.match_document(query_embedding, k)
             
-            if result.data:
-                docs = []
-                for item in result.data:
-                    docs.append({
-                        'content': item.get('content', ''),
-                        'metadata': item.get('metadata', {}),
-                        'similarity': item.get('similarity', 0)
-                    })
+            if rows:
+                docs = build_search_result(rows)
+                semantic_cache.put(query_embedding, k, docs)
                 return docs
             
-            return []
+            return build_search_result([])
             
-        except Exception as e:
-            print(f"[IT Auditor] Error searching documents: {e}")
-            return []
+        except Exception:
+            log.exception("Error searching documents")
+            return build_search_result([])
 
     async def scan(self):
         """Run autonomous IT audit scan"""
         self.status = "scanning"
-        print(f"[IT Auditor] Starting scan at {datetime.now()}")
+        self._refresh_status()
+        log.info("Starting scan")
+        started = time.monotonic()
         
         try:
+            # Embed every detector query in one request, alongside the trigger phrases on first scan
+            query_embeddings, _ = await asyncio.gather(
+                self._embed_scan_queries(),
+                self.get_trigger_embeddings()
+            )
+
             # Run all IT checks
-            cab_violations = await self._detect_cab_violations()
-            sod_issues = await self._detect_sod_violations()
-            admin_rights = await self._detect_excessive_admin_rights()
+            cab_violations = await self._detect_cab_violations(query_embeddings["cab"])
+            sod_issues = await self._detect_sod_violations(query_embeddings["sod"])
+            admin_rights = await self._detect_excessive_admin_rights(query_embeddings["admin_rights"])
 
             # Compile findings
             self.findings = []
@@ -101,121 +167,129 @@ class ITAuditorAgent:
             
             self.confidence = self._calculate_confidence()
             self.status = "active"
-            self.last_scan = datetime.now().isoformat()
+            self.last_scan = time.time()
+            self._refresh_status()
             
-            print(f"[IT Auditor] Scan complete. Found {len(self.findings)} issues")
+            log.info("Scan complete in %.2fs. Found %d issues", time.monotonic() - started, len(self.findings))
             
             return {
                 "status": self.status,
                 "confidence": self.confidence,
                 "findings": self.findings,
-                "last_scan": self.last_scan
+                "last_scan": self._status_cache["last_scan"]
             }
             
         except Exception as e:
-            print(f"[IT Auditor] Error: {str(e)}")
+            log.exception("Scan failed")
             self.status = "error"
+            self._refresh_status()
             return {
                 "status": "error",
                 "error": str(e)
             }
 
-    async def _detect_cab_violations(self):
+    async def _detect_cab_violations(self, query_embedding=None):
         """Detect production changes without CAB approval"""
         try:
             docs = await self._search_documents(
-                "CAB production change approval PRD deployment change advisory board",
-                k=3
+                self.SCAN_QUERIES["cab"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[IT Auditor] No documents found for CAB violations")
+            if not docs['contents']:
+                log.debug("No documents found for CAB violations")
                 return None
             
-            print(f"[IT Auditor] Found {len(docs)} documents for CAB analysis")
+            log.debug("Found %d documents for CAB analysis", len(docs['contents']))
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["cab"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._CAB_TRIGGER.match(context))
             
-            if ("cab" in context or "change advisory" in context or "production" in context):
-                if "without" in context or "bypass" in context or "missing" in context:
-                    print("[IT Auditor] CAB violations detected")
-                    return "Production changes deployed without Change Advisory Board approval"
+            if matched:
+                log.info("CAB violations detected")
+                return "Production changes deployed without Change Advisory Board approval"
             
             return None
             
-        except Exception as e:
-            print(f"[IT Auditor] Error detecting CAB violations: {e}")
+        except Exception:
+            log.exception("Error detecting CAB violations")
             return None
 
-    async def _detect_sod_violations(self):
+    async def _detect_sod_violations(self, query_embedding=None):
         """Detect Segregation of Duties violations"""
         try:
             docs = await self._search_documents(
-                "segregation of duties SoD conflict same user permissions access control",
-                k=3
+                self.SCAN_QUERIES["sod"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[IT Auditor] No documents found for SoD violations")
+            if not docs['contents']:
+                log.debug("No documents found for SoD violations")
                 return None
             
-            print(f"[IT Auditor] Found {len(docs)} documents for SoD analysis")
+            log.debug("Found %d documents for SoD analysis", len(docs['contents']))
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["sod"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._SOD_TRIGGER.match(context))
             
-            if "segregation" in context or "sod" in context or "conflict" in context:
-                if "violation" in context or "same user" in context or "dual" in context:
-                    print("[IT Auditor] SoD violations detected")
-                    return "Users have conflicting permissions enabling fraud risk (e.g., create and approve payments)"
+            if matched:
+                log.info("SoD violations detected")
+                return "Users have conflicting permissions enabling fraud risk (e.g., create and approve payments)"
             
             return None
             
-        except Exception as e:
-            print(f"[IT Auditor] Error detecting SoD violations: {e}")
+        except Exception:
+            log.exception("Error detecting SoD violations")
             return None
 
-    async def _detect_excessive_admin_rights(self):
+    async def _detect_excessive_admin_rights(self, query_embedding=None):
         """Detect excessive administrative privileges"""
         try:
             docs = await self._search_documents(
-                "admin rights administrator privileges superuser excessive permissions",
-                k=3
+                self.SCAN_QUERIES["admin_rights"],
+                k=3,
+                query_embedding=query_embedding
             )
             
-            if not docs or len(docs) == 0:
-                print("[IT Auditor] No documents found for admin rights")
+            if not docs['contents']:
+                log.debug("No documents found for admin rights")
                 return None
             
-            print(f"[IT Auditor] Found {len(docs)} documents for admin rights analysis")
+            log.debug("Found %d documents for admin rights analysis", len(docs['contents']))
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            matched = docs_match_triggers(docs, (await self.get_trigger_embeddings())["admin_rights"])
+            if matched is None:
+                # No stored embeddings returned, fall back to a keyword check
+                context = "\n".join(docs['contents'])
+                matched = bool(self._ADMIN_TRIGGER.match(context))
             
-            if "admin" in context or "administrator" in context or "privilege" in context:
-                if "excessive" in context or "too many" in context or "unnecessary" in context:
-                    print("[IT Auditor] Excessive admin rights detected")
-                    return "Multiple users have unnecessary administrative privileges violating least privilege principle"
+            if matched:
+                log.info("Excessive admin rights detected")
+                return "Multiple users have unnecessary administrative privileges violating least privilege principle"
             
             return None
             
-        except Exception as e:
-            print(f"[IT Auditor] Error detecting admin rights: {e}")
+        except Exception:
+            log.exception("Error detecting admin rights")
             return None
 
     def _calculate_confidence(self):
         """Calculate agent confidence score"""
-        if len(self.findings) == 0:
-            return 0.94
-        elif len(self.findings) <= 2:
-            return 0.91
-        else:
-            return 0.87
+        return _CONFIDENCE_BY_FINDINGS[min(len(self.findings), 3)]
 
     async def explain_finding(self, finding_title: str):
         """Generate detailed explanation for a finding"""
         try:
-            llm = self.get_llm(temperature=0.3)
             docs = await self._search_documents(finding_title, k=3)
-            context = "\n\n".join([doc['content'] for doc in docs])
+            context = "\n\n".join(docs['contents'])
             
             prompt = f"""You are an IT Auditor AI agent. Explain this IT control finding in detail:
 
@@ -232,34 +306,36 @@ Provide:
 
 Be specific and reference details from the context."""
             
-            response = llm.invoke(prompt)
+            response = await explain_batcher.submit(prompt)
             return response.content
             
         except Exception as e:
-            print(f"[IT Auditor] Error generating explanation: {e}")
+            log.exception("Error generating explanation")
             return f"Error generating explanation: {str(e)}"
 
-    def get_status(self):
-        """Get current agent status"""
-        return {
+    def _refresh_status(self):
+        """Rebuild the cached status dict (call after any state change)"""
+        # last_scan is kept as a UTC epoch and only formatted here
+        last_scan = datetime.fromtimestamp(self.last_scan, tz=timezone.utc).isoformat() if self.last_scan else None
+        self._status_cache = {
             "agent": "IT Auditor",
             "status": self.status,
             "confidence": self.confidence,
             "findings_count": len(self.findings),
             "findings": self.findings,
-            "last_scan": self.last_scan
+            "last_scan": last_scan
         }
 
+    def get_status(self):
+        """Get current agent status"""
+        return self._status_cache
 
-# Singleton agent instance
-it_agent = None
 
+# Singleton agent instance
+@cache
 def get_it_agent():
     """Get or create IT agent instance"""
-    global it_agent
-    if it_agent is None:
-        it_agent = ITAuditorAgent()
-    return it_agent
+    return ITAuditorAgent()
 
 async def run_it_agent():
     """Run the IT auditor agent"""
@@ -0,0 +1,86 @@
+"""
+LLM micro-batcher - coalesces concurrent prompts into batched Gemini calls
+"""
+import asyncio
+import logging
+from services.rag_assistant import get_shared_llm
+
+log = logging.getLogger(__name__)
+
+BATCH_WINDOW_SECONDS = 0.01
+MAX_BATCH_SIZE = 8
+
+
+class LLMBatcher:
+    """Collects prompts that arrive within a short window and sends them together with llm.abatch"""
+
+    def __init__(self, temperature=0.3):
+        self.temperature = temperature
+        self._queue = None
+        self._loop = None
+        self._worker = None
+        self._flushes = set()
+
+    def _ensure_worker(self):
+        # Queue and worker belong to the running event loop, so create them lazily, once per loop
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = None
+        
+        if self._worker is None or self._worker.done():
+            if self._worker is not None and not self._worker.cancelled() and self._worker.exception():
+                log.error("LLM batch worker died, restarting", exc_info=self._worker.exception())
+            # Restarted workers keep draining the same queue, so pending prompts are not lost
+            self._worker = asyncio.create_task(self._collect())
+
+    async def _collect(self):
+        while True:
+            items = [await self._queue.get()]
+            try:
+                await asyncio.sleep(BATCH_WINDOW_SECONDS)
+                while len(items) < MAX_BATCH_SIZE and not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+
+                # Flush in the background so the next window can start collecting
+                task = asyncio.create_task(self._flush(items))
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+            except asyncio.CancelledError:
+                # Don't leave submitters of an unsent batch waiting forever
+                for _, future in items:
+                    future.cancel()
+                raise
+            except Exception as e:
+                # Fail only this batch, the worker keeps serving the queue
+                log.exception("Error collecting LLM batch")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, items):
+        llm = get_shared_llm(self.temperature)
+        try:
+            responses = await llm.abatch([prompt for prompt, _ in items], return_exceptions=True)
+        except Exception as e:
+            responses = [e] * len(items)
+
+        for (_, future), response in zip(items, responses):
+            if future.done():
+                continue
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+    async def submit(self, prompt):
+        """Queue a prompt and wait for its response message"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, future))
+        return await future
+
+
+# Shared batcher for finding explanations across all agents
+explain_batcher = LLMBatcher(temperature=0.3)
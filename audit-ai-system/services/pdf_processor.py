@@ -1,12 +1,33 @@
-import tempfile
-import os
+import io
+import asyncio
+import hashlib
+import json
+from itertools import islice
 from typing import List
-from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from supabase_client import supabase
+from services import semantic_cache
 from config import settings
 
+# Gemini accepts at most this many texts per batch embedding request
+EMBED_BATCH_SIZE = 96
+
+# Rows per bulk insert, keeps PostgREST request bodies under the payload limit
+INSERT_BATCH_SIZE = 500
+
+# Hashes per embedding_cache lookup, keeps the in.(...) filter within URL length limits
+CACHE_LOOKUP_BATCH_SIZE = 100
+
+# Shared splitter, built once instead of per document
+_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    length_function=len,
+)
+
 # Initialize Gemini embeddings
 embeddings = None
 
@@ -21,73 +42,181 @@ def get_embeddings():
     return embeddings
 
 
-async def process_all_pdfs():
-    """Process all unprocessed PDFs from Supabase Storage"""
-    embeddings = get_embeddings()
+def _batched(iterable, n):
+    """Yield successive lists of up to n items"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+def _load_pages(file_bytes, filename):
+    """Parse PDF bytes in memory into LangChain page documents"""
+    reader = PdfReader(io.BytesIO(file_bytes))
+    return [
+        Document(
+            page_content=page.extract_text() or '',
+            metadata={'page': idx, 'source': filename}
+        )
+        for idx, page in enumerate(reader.pages)
+    ]
+
+
+async def _embed_texts(texts, embeddings):
+    """Embed chunk texts, reusing vectors from the embedding_cache table for identical content"""
+    hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
     
-    # Get unprocessed documents
-    response = supabase.table('audit_documents').select('*').eq('processed', False).execute()
+    # Look up cached vectors for this model
+    cached = {}
+    for batch in _batched(set(hashes), CACHE_LOOKUP_BATCH_SIZE):
+        result = await asyncio.to_thread(
+            lambda batch=batch: supabase.table('embedding_cache')
+                .select('content_hash, embedding')
+                .eq('model', settings.EMBEDDING_MODEL)
+                .in_('content_hash', batch)
+                .execute()
+        )
+        for row in result.data or []:
+            embedding = row['embedding']
+            cached[row['content_hash']] = json.loads(embedding) if isinstance(embedding, str) else embedding
     
-    if not response.data:
-        return {"message": "No PDFs to process", "processed": 0}
+    # Embed only the misses, once per distinct text
+    misses = {}
+    for text, content_hash in zip(texts, hashes):
+        if content_hash not in cached:
+            misses.setdefault(content_hash, text)
     
-    all_chunks_text = []
-    processed_count = 0
+    new_rows = []
+    for batch in _batched(misses.items(), EMBED_BATCH_SIZE):
+        vectors = await asyncio.to_thread(embeddings.embed_documents, [text for _, text in batch])
+        for (content_hash, _), vector in zip(batch, vectors):
+            cached[content_hash] = vector
+            new_rows.append({
+                'content_hash': content_hash,
+                'model': settings.EMBEDDING_MODEL,
+                'embedding': vector
+            })
+    
+    for batch in _batched(new_rows, INSERT_BATCH_SIZE):
+        await asyncio.to_thread(
+            lambda batch=batch: supabase.table('embedding_cache').upsert(batch).execute()
+        )
+    
+    return [cached[content_hash] for content_hash in hashes]
+
+
+async def _mark_processed(doc, content_sha256):
+    """Flag a document as processed and record its content hash"""
+    await asyncio.to_thread(
+        lambda: supabase.table('audit_documents').update({
+            'processed': True,
+            'content_sha256': content_sha256
+        }).eq('id', doc['id']).execute()
+    )
+
+
+async def _clone_matching_document(doc, content_sha256):
+    """Copy chunks from a processed document with the same content hash; returns the chunk count or 0"""
+    match = await asyncio.to_thread(
+        lambda: supabase.table('audit_documents')
+            .select('id')
+            .eq('content_sha256', content_sha256)
+            .eq('processed', True)
+            .neq('id', doc['id'])
+            .limit(1)
+            .execute()
+    )
+    if not match.data:
+        return 0
     
-    for doc in response.data:
+    result = await asyncio.to_thread(
+        lambda: supabase.rpc('clone_chunks', {
+            'src_id': match.data[0]['id'],
+            'dst_id': doc['id']
+        }).execute()
+    )
+    copied = result.data or 0
+    if copied:
+        await _mark_processed(doc, content_sha256)
+    return copied
+
+
+async def _process_one(doc, embeddings, semaphore):
+    """Download, chunk, embed and store a single PDF; returns the chunk count or None on failure"""
+    async with semaphore:
         print(f"Processing: {doc['filename']}")
         
         try:
             # Download PDF from Storage
-            file_bytes = supabase.storage.from_('audit-documents').download(doc['storage_path'])
+            file_bytes = await asyncio.to_thread(
+                supabase.storage.from_('audit-documents').download, doc['storage_path']
+            )
+            
+            content_sha256 = hashlib.sha256(file_bytes).hexdigest()
             
-            # Save temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(file_bytes)
-                tmp_path = tmp_file.name
+            # Identical bytes already processed under another document: copy its chunks
+            cloned = await _clone_matching_document(doc, content_sha256)
+            if cloned:
+                return cloned
             
-            # Load PDF
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load()
+            pages = await asyncio.to_thread(_load_pages, file_bytes, doc['filename'])
             
             # Split into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-            )
-            chunks = text_splitter.split_documents(pages)
+            chunks = _SPLITTER.split_documents(pages)
+            
+            # Generate embeddings, skipping chunks already in the embedding cache
+            texts = [chunk.page_content for chunk in chunks]
+            vectors = await _embed_texts(texts, embeddings)
             
-            # Generate embeddings and store
-            for idx, chunk in enumerate(chunks):
-                embedding = embeddings.embed_query(chunk.page_content)
-                
-                supabase.table('document_chunks').insert({
+            # Store chunks with bulk inserts
+            rows = [
+                {
                     'document_id': doc['id'],
                     'chunk_text': chunk.page_content,
                     'chunk_index': idx,
                     'embedding': embedding,
                     'metadata': chunk.metadata
-                }).execute()
-                
-                all_chunks_text.append(chunk.page_content)
+                }
+                for idx, (chunk, embedding) in enumerate(zip(chunks, vectors))
+            ]
+            for batch in _batched(rows, INSERT_BATCH_SIZE):
+                await asyncio.to_thread(
+                    lambda batch=batch: supabase.table('document_chunks').insert(batch).execute()
+                )
             
             # Mark as processed
-            supabase.table('audit_documents').update({
-                'processed': True
-            }).eq('id', doc['id']).execute()
-            
-            processed_count += 1
+            await _mark_processed(doc, content_sha256)
             
-            # Cleanup temp file
-            os.unlink(tmp_path)
+            return len(rows)
             
         except Exception as e:
             print(f"Error processing {doc['filename']}: {str(e)}")
-            continue
+            return None
+
+
+async def process_all_pdfs():
+    """Process all unprocessed PDFs from Supabase Storage"""
+    embeddings = get_embeddings()
+    
+    # Get unprocessed documents
+    response = supabase.table('audit_documents').select('*').eq('processed', False).execute()
+    
+    if not response.data:
+        return {"message": "No PDFs to process", "processed": 0}
+    
+    # Overlap downloads, embedding calls and inserts across PDFs
+    semaphore = asyncio.Semaphore(settings.PDF_CONCURRENCY)
+    results = await asyncio.gather(
+        *[_process_one(doc, embeddings, semaphore) for doc in response.data]
+    )
+    chunk_counts = [count for count in results if count is not None]
+    processed_count = len(chunk_counts)
+    
+    if processed_count:
+        # New chunks can change search results for queries already cached
+        semantic_cache.clear()
     
     return {
         "message": f"Successfully processed {processed_count} PDFs",
         "processed": processed_count,
-        "chunks_created": len(all_chunks_text)
+        "chunks_created": sum(chunk_counts)
     }
@@ -3,17 +3,59 @@ Process Miner Agent - Autonomous process analysis
 """
 from langchain_google_genai import ChatGoogleGenerativeAI
 from supabase_client import supabase
+import db
 from config import settings
-from services.rag_assistant import get_embeddings
+from services.rag_assistant import get_embeddings, cached_embed_query
 import json
 from datetime import datetime
 import asyncio
+import re
+import numpy as np
+
+# Detector keywords by category, matched against the retrieved context in a single pass
+KEYWORD_CATEGORIES = {
+    'approval': ('approval', 'authorization'),
+    'gap': ('missing', 'skip', 'bypass'),
+    'delay': ('bottleneck', 'delay', 'slow'),
+    'grn': ('grn', 'receipt', 'goods'),
+    'rework': ('rework', 'loop', 'repeat'),
+}
+_KEYWORD_TO_CATEGORY = {
+    keyword: category
+    for category, keywords in KEYWORD_CATEGORIES.items()
+    for keyword in keywords
+}
+_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, _KEYWORD_TO_CATEGORY)))
+
+
+# Confidence indexed by number of findings (0, 1, 2, 3+)
+_CONFIDENCE_BY_FINDINGS = (0.92, 0.88, 0.88, 0.84)
+
+# Largest confidence reduction for findings backed only by weakly matching chunks
+MAX_SIMILARITY_PENALTY = 0.2
+
+
+def _similarities(docs):
+    """Similarity scores of retrieved docs as a float32 array"""
+    return np.fromiter((doc.get('similarity', 0) for doc in docs), dtype=np.float32, count=len(docs))
+
+
+def _keyword_hits(context):
+    """Return the keyword categories present in a lowercased context"""
+    return {_KEYWORD_TO_CATEGORY[match.group(0)] for match in _KEYWORD_PATTERN.finditer(context)}
 
 
 class ProcessMinerAgent:
     """Specialized AI agent for process mining and workflow analysis"""
     _embeddings = None
     _llm = None
+
+    # Retrieval query for each detector, searched together in one RPC per scan
+    SCAN_QUERIES = {
+        'approval': "approval path missing authorization workflow bypassed",
+        'bottleneck': "bottleneck delay GRN goods receipt note slow processing",
+        'rework': "rework loop correction repeat O2C order to cash",
+    }
     
     def __init__(self):
         self.status = "idle"
@@ -39,19 +81,16 @@ class ProcessMinerAgent:
         return ProcessMinerAgent._llm
 
     async def _search_documents(self, query: str, k: int = 3):
-        """Search documents using direct Supabase RPC call"""
+        """Search documents with a direct match_document query"""
         try:
-            embeddings_model = self.get_embeddings()
-            query_embedding = embeddings_model.embed_query(query)
+            query_embedding = await asyncio.to_thread(cached_embed_query, query)
             
-            result = supabase.rpc(
-                'match_document',
-                {'query_embedding': query_embedding}
-            ).limit(k).execute()
+            # Query Postgres directly over the asyncpg pool, bypassing PostgREST
+            rows = await db.match_document(query_embedding, k)
             
-            if result.data:
+            if rows:
                 docs = []
-                for item in result.data:
+                for item in rows:
                     docs.append({
                         'content': item.get('content', ''),
                         'metadata': item.get('metadata', {}),
@@ -65,25 +104,61 @@ class ProcessMinerAgent:
             print(f"[Process Miner] Error searching documents: {e}")
             return []
 
+    async def _search_documents_multi(self, queries, k: int = 3):
+        """Search documents for several queries with one match_document_multi RPC call"""
+        try:
+            query_embeddings = await asyncio.gather(
+                *[asyncio.to_thread(cached_embed_query, query) for query in queries]
+            )
+            
+            result = await asyncio.to_thread(
+                lambda: supabase.rpc(
+                    'match_document_multi',
+                    {'query_embeddings': list(query_embeddings), 'match_count': k}
+                ).execute()
+            )
+            
+            docs_per_query = [[] for _ in queries]
+            for item in result.data or []:
+                docs_per_query[item['query_index']].append({
+                    'content': item.get('content', ''),
+                    'metadata': item.get('metadata', {}),
+                    'similarity': item.get('similarity', 0)
+                })
+            return docs_per_query
+            
+        except Exception as e:
+            print(f"[Process Miner] Error searching documents: {e}")
+            return [[] for _ in queries]
+
     async def scan(self):
         """Run autonomous process analysis scan"""
         self.status = "scanning"
         print(f"[Process Miner] Starting scan at {datetime.now()}")
         
         try:
+            # Retrieve context for every detector in one round-trip
+            approval_docs, bottleneck_docs, rework_docs = await self._search_documents_multi(
+                list(self.SCAN_QUERIES.values()), k=3
+            )
+            
             # Run all checks
-            approval_issues = await self._detect_approval_violations()
-            bottlenecks = await self._detect_bottlenecks()
-            rework_loops = await self._detect_rework_loops()
+            approval_issues, bottlenecks, rework_loops = await asyncio.gather(
+                self._detect_approval_violations(approval_docs),
+                self._detect_bottlenecks(bottleneck_docs),
+                self._detect_rework_loops(rework_docs)
+            )
 
-            # Compile findings
+            # Compile findings, keeping the similarity scores of the chunks behind each one
             self.findings = []
+            finding_similarities = []
             if approval_issues:
                 self.findings.append({
                     "title": "Skipped approval path",
                     "severity": "high",
                     "details": approval_issues
                 })
+                finding_similarities.append(_similarities(approval_docs))
             
             if bottlenecks:
                 self.findings.append({
@@ -91,6 +166,7 @@ class ProcessMinerAgent:
                     "severity": "medium",
                     "details": bottlenecks
                 })
+                finding_similarities.append(_similarities(bottleneck_docs))
             
             if rework_loops:
                 self.findings.append({
@@ -98,8 +174,9 @@ class ProcessMinerAgent:
                     "severity": "medium",
                     "details": rework_loops
                 })
+                finding_similarities.append(_similarities(rework_docs))
             
-            self.confidence = self._calculate_confidence()
+            self.confidence = self._calculate_confidence(finding_similarities)
             self.status = "active"
             self.last_scan = datetime.now().isoformat()
             
@@ -120,13 +197,11 @@ class ProcessMinerAgent:
                 "error": str(e)
             }
 
-    async def _detect_approval_violations(self):
+    async def _detect_approval_violations(self, docs=None):
         """Detect skipped approval paths"""
         try:
-            docs = await self._search_documents(
-                "approval path missing authorization workflow bypassed",
-                k=3
-            )
+            if docs is None:
+                docs = await self._search_documents(self.SCAN_QUERIES['approval'], k=3)
             
             if not docs or len(docs) == 0:
                 print("[Process Miner] No documents found for approval violations")
@@ -134,10 +209,10 @@ class ProcessMinerAgent:
             
             print(f"[Process Miner] Found {len(docs)} documents for approval analysis")
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            hits = _keyword_hits("\n".join([doc['content'].lower() for doc in docs]))
             
-            if "approval" in context or "authorization" in context:
-                if "missing" in context or "skip" in context or "bypass" in context:
+            if 'approval' in hits:
+                if 'gap' in hits:
                     print("[Process Miner] Approval violations detected")
                     return "Purchase orders bypassing required approval workflows"
             
@@ -147,21 +222,19 @@ class ProcessMinerAgent:
             print(f"[Process Miner] Error detecting approval violations: {e}")
             return None
 
-    async def _detect_bottlenecks(self):
+    async def _detect_bottlenecks(self, docs=None):
         """Detect process bottlenecks"""
         try:
-            docs = await self._search_documents(
-                "bottleneck delay GRN goods receipt note slow processing",
-                k=3
-            )
+            if docs is None:
+                docs = await self._search_documents(self.SCAN_QUERIES['bottleneck'], k=3)
             
             if not docs or len(docs) == 0:
                 return None
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            hits = _keyword_hits("\n".join([doc['content'].lower() for doc in docs]))
             
-            if "bottleneck" in context or "delay" in context or "slow" in context:
-                if "grn" in context or "receipt" in context or "goods" in context:
+            if 'delay' in hits:
+                if 'grn' in hits:
                     return "Goods Receipt Note processing delays impacting invoice matching"
             
             return None
@@ -170,20 +243,18 @@ class ProcessMinerAgent:
             print(f"[Process Miner] Error detecting bottlenecks: {e}")
             return None
 
-    async def _detect_rework_loops(self):
+    async def _detect_rework_loops(self, docs=None):
         """Detect rework and process loops"""
         try:
-            docs = await self._search_documents(
-                "rework loop correction repeat O2C order to cash",
-                k=3
-            )
+            if docs is None:
+                docs = await self._search_documents(self.SCAN_QUERIES['rework'], k=3)
             
             if not docs or len(docs) == 0:
                 return None
             
-            context = "\n".join([doc['content'].lower() for doc in docs])
+            hits = _keyword_hits("\n".join([doc['content'].lower() for doc in docs]))
             
-            if "rework" in context or "loop" in context or "repeat" in context:
+            if 'rework' in hits:
                 return "Order-to-Cash process requires frequent corrections and reprocessing"
             
             return None
@@ -192,14 +263,18 @@ class ProcessMinerAgent:
             print(f"[Process Miner] Error detecting rework loops: {e}")
             return None
 
-    def _calculate_confidence(self):
-        """Calculate agent confidence score"""
-        if len(self.findings) == 0:
-            return 0.92
-        elif len(self.findings) <= 2:
-            return 0.88
-        else:
-            return 0.84
+    def _calculate_confidence(self, finding_similarities=()):
+        """
+        Calculate agent confidence score: a baseline by finding count, lowered when
+        the findings rest on chunks with low similarity to the detector queries.
+        """
+        confidence = _CONFIDENCE_BY_FINDINGS[min(len(self.findings), 3)]
+        similarities = [sims for sims in finding_similarities if sims.size]
+        if similarities:
+            mean_similarity = float(np.concatenate(similarities).mean())
+            penalty = float(np.clip((1 - mean_similarity) * 0.3, 0, MAX_SIMILARITY_PENALTY))
+            confidence = round(confidence - penalty, 2)
+        return confidence
 
     async def explain_finding(self, finding_title: str):
         """Generate detailed explanation for a finding"""
@@ -2,44 +2,132 @@ from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmb
 from langchain_community.vectorstores import SupabaseVectorStore
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from langchain_core.embeddings import Embeddings
 from supabase_client import supabase
 from config import settings
+from functools import cache, lru_cache
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import numpy as np
 
 # Global instances
-embeddings = None
 llm = None
 vector_store = None
 qa_chain = None
 
+# Cosine similarity above which a retrieved chunk counts as matching a trigger phrase
+TRIGGER_SIMILARITY_THRESHOLD = 0.75
 
+# Query embeddings keyed by (sha256 of text, embedding model), least recently used evicted first
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+_query_embedding_cache = OrderedDict()
+_query_embedding_lock = threading.Lock()
+
+
+@cache
 def get_embeddings():
     """Initialize embeddings (lazy loading)"""
-    global embeddings
-    if embeddings is None:
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model=settings.EMBEDDING_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY
-        )
-    return embeddings
+    return GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        google_api_key=settings.GOOGLE_API_KEY
+    )
+
+
+@lru_cache(maxsize=4)
+def get_shared_llm(temperature=0.3):
+    """Shared LLM client per temperature, reused by all agents so they share one connection pool"""
+    return ChatGoogleGenerativeAI(
+        model=settings.GEMINI_MODEL,
+        temperature=temperature,
+        google_api_key=settings.GOOGLE_API_KEY
+    )
 
 
 def get_llm():
     """Initialize LLM (lazy loading)"""
     global llm
     if llm is None:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",  # Use from settings (gemini-1.5-flash)
-            temperature=0.3,
-            google_api_key=settings.GOOGLE_API_KEY
-        )
+        llm = get_shared_llm(0.3)
     return llm
 
 
+def cached_embed_query(text):
+    """Embed a query string, reusing the vector for text already embedded with the current model"""
+    key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), settings.EMBEDDING_MODEL)
+    with _query_embedding_lock:
+        if key in _query_embedding_cache:
+            _query_embedding_cache.move_to_end(key)
+            return list(_query_embedding_cache[key])
+
+    vector = tuple(get_embeddings().embed_query(text))
+    with _query_embedding_lock:
+        _query_embedding_cache[key] = vector
+        if len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return list(vector)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings for the QA retriever that serve repeated questions from the query embedding cache"""
+
+    def embed_documents(self, texts):
+        return get_embeddings().embed_documents(texts)
+
+    def embed_query(self, text):
+        return cached_embed_query(text)
+
+
+def embed_triggers(triggers):
+    """Embed named groups of trigger phrases in one call, returning L2-normalized arrays per group"""
+    phrases = [phrase for group in triggers.values() for phrase in group]
+    vectors = np.asarray(get_embeddings().embed_documents(phrases), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    result = {}
+    start = 0
+    for name, group in triggers.items():
+        result[name] = vectors[start:start + len(group)]
+        start += len(group)
+    return result
+
+
+def build_search_result(rows):
+    """Convert match_document rows into parallel column lists plus a float32 similarity array"""
+    return {
+        'contents': [row.get('content', '') for row in rows],
+        'metadatas': [row.get('metadata', {}) for row in rows],
+        'embeddings': [row.get('embedding') for row in rows],
+        'similarities': np.asarray([row.get('similarity', 0) for row in rows], dtype=np.float32)
+    }
+
+
+def docs_match_triggers(docs, trigger_embeddings, threshold=TRIGGER_SIMILARITY_THRESHOLD):
+    """
+    Check whether any retrieved chunk is close to any trigger phrase.
+    Returns None when the docs carry no embeddings so callers can fall back.
+    """
+    doc_vectors = []
+    for vector in docs['embeddings']:
+        if vector:
+            # pgvector columns come back from PostgREST as '[...]' strings
+            doc_vectors.append(json.loads(vector) if isinstance(vector, str) else vector)
+
+    if not doc_vectors:
+        return None
+
+    doc_embs = np.asarray(doc_vectors, dtype=np.float32)
+    doc_embs /= np.linalg.norm(doc_embs, axis=1, keepdims=True)
+    scores = doc_embs @ trigger_embeddings.T
+    return bool((scores.max(axis=0) > threshold).any())
+
+
 def get_vector_store():
     """Initialize vector store (lazy loading)"""
     global vector_store
     if vector_store is None:
-        emb = get_embeddings()
+        emb = CachedQueryEmbeddings()
         vector_store = SupabaseVectorStore(
             client=supabase,
             embedding=emb,
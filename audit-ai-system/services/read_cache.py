@@ -0,0 +1,44 @@
+"""
+Short-lived cache for dashboard read endpoints - data only changes when risks are recalculated
+"""
+import functools
+import time
+from collections import OrderedDict
+
+READ_CACHE_TTL_SECONDS = 30
+READ_CACHE_MAX_ENTRIES = 256
+
+# (function name, args) -> (expiry time, result), oldest first; every entry has the
+# same TTL, so insertion order is also expiry order
+_entries = OrderedDict()
+
+
+def _evict(now):
+    """Drop expired entries from the front, then the oldest ones beyond the size limit"""
+    while _entries and next(iter(_entries.values()))[0] <= now:
+        _entries.popitem(last=False)
+    while len(_entries) >= READ_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def cached_read(func):
+    """Cache an async read function's result for READ_CACHE_TTL_SECONDS"""
+    @functools.wraps(func)
+    async def wrapper(*args):
+        key = (func.__name__, args)
+        entry = _entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        result = await func(*args)
+        now = time.monotonic()
+        _entries.pop(key, None)
+        _evict(now)
+        _entries[key] = (now + READ_CACHE_TTL_SECONDS, result)
+        return result
+    return wrapper
+
+
+def clear():
+    """Drop all cached reads (call after the underlying tables are written)"""
+    _entries.clear()
@@ -3,6 +3,7 @@ from langchain.prompts import PromptTemplate
 from supabase_client import supabase
 from config import settings
 import json
+import asyncio
 
 # Initialize Gemini LLM with higher temperature for creative writing
 llm = None
@@ -17,16 +18,36 @@ def get_llm():
         )
     return llm
 
-async def generate_executive_summary():
-    """Generate executive summary report using Gemini"""
-    llm=get_llm()
-    # Get latest metrics
-    metrics_response = supabase.table('audit_metrics').select('*').order('last_updated', desc=True).limit(1).execute()
-    findings_response = supabase.table('audit_findings').select('*').execute()
-    heatmap_response = supabase.table('risk_heatmap').select('*').limit(10).execute()
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["context"],
+    template="""Generate a professional executive summary audit report based on the following data:
+
+{context}
+
+The report should include:
+1. Executive Summary (2-3 paragraphs)
+2. Key Findings Highlight
+3. Risk Assessment
+4. Recommendations
+5. Conclusion
+
+Make it professional, concise, and actionable."""
+)
+
+async def _load_summary_inputs():
+    """Fetch the latest metrics and build the summary prompt; returns (metrics, prompt) or (None, None)"""
+    # Get latest metrics and sample findings concurrently (only the first 5 findings go in the prompt)
+    metrics_response, findings_response = await asyncio.gather(
+        asyncio.to_thread(
+            lambda: supabase.table('audit_metrics').select('*').order('last_updated', desc=True).limit(1).execute()
+        ),
+        asyncio.to_thread(
+            lambda: supabase.table('audit_findings').select('*').limit(5).execute()
+        )
+    )
     
     if not metrics_response.data:
-        return {"error": "No metrics available"}
+        return None, None
     
     metrics = metrics_response.data[0]
     findings = findings_response.data if findings_response.data else []
@@ -45,35 +66,59 @@ async def generate_executive_summary():
     Sample Findings: {json.dumps(findings[:5], indent=2) if findings else "No findings available"}
     """
     
-    prompt = PromptTemplate(
-        input_variables=["context"],
-        template="""Generate a professional executive summary audit report based on the following data:
+    return metrics, SUMMARY_PROMPT.format(context=context)
 
-{context}
+def _store_summary(summary_text, metrics):
+    """Store a generated executive summary in audit_reports"""
+    return supabase.table('audit_reports').insert({
+        'summary_text': summary_text,
+        'report_type': 'Executive Summary',
+        'metrics_snapshot': metrics,
+        'created_by': None
+    }).execute()
 
-The report should include:
-1. Executive Summary (2-3 paragraphs)
-2. Key Findings Highlight
-3. Risk Assessment
-4. Recommendations
-5. Conclusion
+async def _stream_summary(metrics, prompt):
+    """Yield summary text chunks as Gemini generates them, storing the full report at the end"""
+    llm=get_llm()
+    chunks = []
+    async for chunk in llm.astream(prompt):
+        chunks.append(chunk.content)
+        yield chunk.content
+    
+    summary_text = "".join(chunks)
+    try:
+        await asyncio.to_thread(_store_summary, summary_text, metrics)
+    except Exception as e:
+        print(f"Error storing streamed report: {str(e)}")
 
-Make it professional, concise, and actionable."""
-    )
+async def stream_executive_summary():
+    """
+    Load the summary inputs and return an async iterator streaming the executive summary text
+    Raises LookupError when no metrics are available, before anything is streamed
+    """
+    metrics, prompt = await _load_summary_inputs()
+    
+    if metrics is None:
+        raise LookupError("No metrics available")
+    
+    return _stream_summary(metrics, prompt)
+
+async def generate_executive_summary():
+    """Generate executive summary report using Gemini"""
+    llm=get_llm()
+    metrics, prompt = await _load_summary_inputs()
+    
+    if metrics is None:
+        return {"error": "No metrics available"}
     
     try:
         print("Generating executive summary report...")
-        response = llm.invoke(prompt.format(context=context))
+        response = llm.invoke(prompt)
         summary_text = response.content
         print("Storing report in database...")
 
         # Store report
-        result = supabase.table('audit_reports').insert({
-            'summary_text': summary_text,
-            'report_type': 'Executive Summary',
-            'metrics_snapshot': metrics,
-            'created_by': None
-        }).execute()
+        result = _store_summary(summary_text, metrics)
         
         print(f"Report stored successfully")
 
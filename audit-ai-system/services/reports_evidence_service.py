@@ -1,9 +1,39 @@
 
 from supabase_client import supabase
+from services import read_cache
+from services.read_cache import cached_read
 from typing import List, Dict, Any
 import asyncio
 from datetime import datetime, timedelta
 
+# Columns returned by list endpoints (only what the dashboard renders, including evidence previews)
+TASK_LIST_COLUMNS = 'task_id,finding_title,anomaly_id,severity,assigned_to,status,due_date'
+EVIDENCE_LIST_COLUMNS = 'file_id,file_name,file_type,file_extension,file_path,description,linked_anomaly_ids,upload_date'
+
+# Task due date offset by anomaly risk, and task owner by reporting agent
+_DUE_DAYS_BY_RISK = {'Critical': 7, 'High': 14, 'Medium': 30, 'Low': 60}
+_OWNER_BY_AGENT = {
+    'Finance Auditor': 'Finance Team',
+    'Process Miner': 'Operations Team',
+    'IT Auditor': 'IT Team',
+    'Compliance Checker': 'Compliance Team'
+}
+
+# Evidence file extension by evidence code prefix
+_EXTENSION_BY_TYPE = {
+    'INV': 'pdf', 'PO': 'csv', 'CHG': 'log', 
+    'DPIA': 'docx', 'JE': 'xlsx', 'LOG': 'log',
+    'GRN': 'csv', 'USR': 'json', 'PERM': 'json'
+}
+
+# Rows per bulk insert, keeps PostgREST request bodies under the payload limit
+INSERT_BATCH_SIZE = 500
+
+def _insert_in_batches(table: str, rows: List[Dict[str, Any]]):
+    """Insert rows with one request per INSERT_BATCH_SIZE rows"""
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        supabase.table(table).insert(rows[start:start + INSERT_BATCH_SIZE]).execute()
+
 # ============================================
 # REMEDIATION TASKS
 # ============================================
@@ -11,7 +41,7 @@ from datetime import datetime, timedelta
 async def get_all_remediation_tasks():
     """Get all remediation tasks"""
     try:
-        response = supabase.table('remediation_tasks').select('*').order('due_date').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('remediation_tasks').select(TASK_LIST_COLUMNS).order('due_date').execute())
         return response.data
     except Exception as e:
         print(f"Error getting remediation tasks: {str(e)}")
@@ -20,7 +50,7 @@ async def get_all_remediation_tasks():
 async def get_open_remediation_tasks():
     """Get only open/in-progress tasks"""
     try:
-        response = supabase.table('remediation_tasks').select('*').in_('status', ['Open', 'In Progress']).order('due_date').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('remediation_tasks').select(TASK_LIST_COLUMNS).in_('status', ['Open', 'In Progress']).order('due_date').execute())
         return response.data
     except Exception as e:
         print(f"Error getting open tasks: {str(e)}")
@@ -62,32 +92,25 @@ async def sync_tasks_from_anomalies():
     """Auto-generate remediation tasks from open anomalies"""
     try:
         # Get all open/in-progress anomalies
-        anomalies_response = supabase.table('anomalies').select('*').in_('status', ['Open', 'In Progress']).execute()
+        anomalies_response = supabase.table('anomalies').select('id,risk,agent,reasoning').in_('status', ['Open', 'In Progress']).execute()
         anomalies = anomalies_response.data
         
         # Get existing tasks to avoid duplicates
         existing_tasks_response = supabase.table('remediation_tasks').select('anomaly_id').execute()
-        existing_anomaly_ids = [t['anomaly_id'] for t in existing_tasks_response.data if t.get('anomaly_id')]
+        existing_anomaly_ids = {t['anomaly_id'] for t in existing_tasks_response.data if t.get('anomaly_id')}
         
-        tasks_created = 0
+        tasks_to_insert = []
         for anomaly in anomalies:
             # Skip if task already exists for this anomaly
             if anomaly['id'] in existing_anomaly_ids:
                 continue
             
             # Calculate due date based on risk
-            risk_days_map = {'Critical': 7, 'High': 14, 'Medium': 30, 'Low': 60}
-            days = risk_days_map.get(anomaly.get('risk', 'Medium'), 30)
+            days = _DUE_DAYS_BY_RISK.get(anomaly.get('risk', 'Medium'), 30)
             due_date = (datetime.now() + timedelta(days=days)).date()
             
             # Determine owner based on agent
-            agent_owner_map = {
-                'Finance Auditor': 'Finance Team',
-                'Process Miner': 'Operations Team',
-                'IT Auditor': 'IT Team',
-                'Compliance Checker': 'Compliance Team'
-            }
-            owner = agent_owner_map.get(anomaly.get('agent', ''), 'Unassigned')
+            owner = _OWNER_BY_AGENT.get(anomaly.get('agent', ''), 'Unassigned')
             
             # Create task
             task_data = {
@@ -102,8 +125,11 @@ async def sync_tasks_from_anomalies():
                 'created_by': 'system'
             }
             
-            await create_remediation_task(task_data)
-            tasks_created += 1
+            tasks_to_insert.append(task_data)
+            existing_anomaly_ids.add(anomaly['id'])
+        
+        _insert_in_batches('remediation_tasks', tasks_to_insert)
+        tasks_created = len(tasks_to_insert)
         
         print(f"✓ Created {tasks_created} remediation tasks from anomalies")
         return {"status": "success", "tasks_created": tasks_created}
@@ -118,7 +144,7 @@ async def sync_tasks_from_anomalies():
 async def get_all_evidence_files():
     """Get all evidence files"""
     try:
-        response = supabase.table('evidence_files').select('*').eq('is_archived', False).order('upload_date', desc=True).execute()
+        response = await asyncio.to_thread(lambda: supabase.table('evidence_files').select(EVIDENCE_LIST_COLUMNS).eq('is_archived', False).order('upload_date', desc=True).execute())
         return response.data
     except Exception as e:
         print(f"Error getting evidence files: {str(e)}")
@@ -127,7 +153,7 @@ async def get_all_evidence_files():
 async def get_evidence_by_type(file_type: str):
     """Get evidence files filtered by type"""
     try:
-        response = supabase.table('evidence_files').select('*').eq('file_type', file_type).eq('is_archived', False).order('upload_date', desc=True).execute()
+        response = await asyncio.to_thread(lambda: supabase.table('evidence_files').select(EVIDENCE_LIST_COLUMNS).eq('file_type', file_type).eq('is_archived', False).order('upload_date', desc=True).execute())
         return response.data
     except Exception as e:
         print(f"Error getting evidence by type: {str(e)}")
@@ -136,8 +162,9 @@ async def get_evidence_by_type(file_type: str):
 async def get_evidence_by_anomaly(anomaly_id: str):
     """Get evidence linked to a specific anomaly"""
     try:
-        response = supabase.table('evidence_files').select('*').contains('linked_anomaly_ids', [anomaly_id]).execute()
-        return response.data
+        # Indexed lookup on the junction table, embedding the linked evidence_files rows
+        response = supabase.table('evidence_anomaly_links').select('evidence_files(*)').eq('anomaly_id', anomaly_id).execute()
+        return [link['evidence_files'] for link in response.data if link.get('evidence_files')]
     except Exception as e:
         print(f"Error getting evidence for anomaly: {str(e)}")
         raise
@@ -185,14 +212,14 @@ async def sync_evidence_from_anomalies():
     """Create evidence file records from evidence table"""
     try:
         # Get all evidence entries
-        evidence_response = supabase.table('evidence').select('*').execute()
+        evidence_response = supabase.table('evidence').select('evidence_code,description,anomaly_id').execute()
         evidence_entries = evidence_response.data
         
         # Get existing evidence files to avoid duplicates
         existing_files_response = supabase.table('evidence_files').select('file_id').execute()
-        existing_file_ids = [f['file_id'] for f in existing_files_response.data]
+        existing_file_ids = {f['file_id'] for f in existing_files_response.data}
         
-        files_created = 0
+        files_to_insert = []
         for entry in evidence_entries:
             evidence_code = entry.get('evidence_code', '')
             file_id = f"EV-{evidence_code}"
@@ -205,12 +232,7 @@ async def sync_evidence_from_anomalies():
             file_type = evidence_code.split('-')[0] if '-' in evidence_code else 'DOC'
             
             # Determine file extension based on type
-            extension_map = {
-                'INV': 'pdf', 'PO': 'csv', 'CHG': 'log', 
-                'DPIA': 'docx', 'JE': 'xlsx', 'LOG': 'log',
-                'GRN': 'csv', 'USR': 'json', 'PERM': 'json'
-            }
-            extension = extension_map.get(file_type, 'pdf')
+            extension = _EXTENSION_BY_TYPE.get(file_type, 'pdf')
             
             # Create evidence file record
             file_data = {
@@ -224,8 +246,11 @@ async def sync_evidence_from_anomalies():
                 'uploaded_by': 'system'
             }
             
-            await create_evidence_file(file_data)
-            files_created += 1
+            files_to_insert.append(file_data)
+            existing_file_ids.add(file_id)
+        
+        _insert_in_batches('evidence_files', files_to_insert)
+        files_created = len(files_to_insert)
         
         print(f"✓ Created {files_created} evidence file records")
         return {"status": "success", "files_created": files_created}
@@ -237,10 +262,11 @@ async def sync_evidence_from_anomalies():
 # REPORTS GENERATION
 # ============================================
 
+@cached_read
 async def get_all_reports():
     """Get all generated reports"""
     try:
-        response = supabase.table('generated_reports').select('*').order('generated_date', desc=True).execute()
+        response = await asyncio.to_thread(lambda: supabase.table('generated_reports').select('*').order('generated_date', desc=True).execute())
         return response.data
     except Exception as e:
         print(f"Error getting reports: {str(e)}")
@@ -264,20 +290,22 @@ async def create_report_metadata(report_data: Dict[str, Any]):
             report_data['report_id'] = f"RPT-{timestamp}"
         
         response = supabase.table('generated_reports').insert(report_data).execute()
+        read_cache.clear()
         return response.data[0] if response.data else None
     except Exception as e:
         print(f"Error creating report metadata: {str(e)}")
         raise
 
 async def increment_download_count(report_id: str):
-    """Increment download count for a report"""
+    """Increment download count for a report, returning the new count (None if the report doesn't exist)"""
     try:
-        report = await get_report_by_id(report_id)
-        if report:
-            new_count = report.get('download_count', 0) + 1
-            supabase.table('generated_reports').update({'download_count': new_count}).eq('report_id', report_id).execute()
+        # One atomic UPDATE ... RETURNING, no prior read of the report
+        response = await asyncio.to_thread(lambda: supabase.rpc('increment_report_downloads', {'p_report_id': report_id}).execute())
+        read_cache.clear()
+        return response.data
     except Exception as e:
         print(f"Error incrementing download count: {str(e)}")
+        raise
 
 # ============================================
 # ALL DATA IN ONE CALL
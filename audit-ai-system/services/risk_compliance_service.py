@@ -3,182 +3,130 @@ Dynamic Risk & Compliance Service
 Auto-calculates risk from agent findings and anomalies
 """
 from supabase_client import supabase
-from typing import List, Dict, Any
+from services import read_cache
+from services.read_cache import cached_read
+from typing import List, Dict
 import asyncio
+import logging
+from collections import defaultdict
 from datetime import datetime
 
+log = logging.getLogger(__name__)
+
+# Anomaly statuses that count as unresolved
+_OPEN_STATUSES = frozenset({'Open', 'In Progress'})
+
+# Risk levels by severity, breaks ties when picking a cluster's dominant risk
+_RISK_SEVERITY = {'Low': 0, 'Medium': 1, 'High': 2, 'Critical': 3}
+
+# (latest updated_at, row count) of anomalies at the last successful risk calculation
+_last_anomaly_marker = None
+
 # ============================================
 # DYNAMIC RISK CALCULATION
 # ============================================
 
-async def calculate_and_update_all_risks():
+# Cluster definitions (you can make this more sophisticated with ML later)
+CLUSTER_PATTERNS = {
+    1: {'name': 'Payment Processing Issues', 'keywords': ['payment', 'invoice', 'duplicate', '3-way']},
+    2: {'name': 'Access Control Violations', 'keywords': ['sod', 'access', 'permission', 'admin']},
+    3: {'name': 'Invoice Matching Failures', 'keywords': ['invoice', 'match', 'approval']},
+    4: {'name': 'Vendor Compliance Gaps', 'keywords': ['vendor', 'supplier', 'certification']},
+    5: {'name': 'Data Privacy Concerns', 'keywords': ['gdpr', 'dpia', 'privacy', 'data']},
+    6: {'name': 'Change Management Defects', 'keywords': ['change', 'it', 'unapproved']},
+    7: {'name': 'Financial Reconciliation', 'keywords': ['reconciliation', 'gl', 'account']},
+    8: {'name': 'Procurement Workflow', 'keywords': ['po', 'procurement', 'purchase', 'approval']},
+    9: {'name': 'Asset Management', 'keywords': ['asset', 'inventory', 'tracking']},
+    10: {'name': 'Supplier Onboarding', 'keywords': ['onboarding', 'supplier', 'documentation']},
+    11: {'name': 'Contract Compliance', 'keywords': ['contract', 'terms', 'violation']},
+    12: {'name': 'ESG Reporting Gaps', 'keywords': ['esg', 'sustainability', 'emissions']}
+}
+
+def _pattern_risk_counts(patterns: Dict[str, List[str]]):
+    """
+    Count anomalies whose reasoning contains any keyword of each pattern, server-side.
+    Returns ({pattern_key: [(risk, status, count), ...]}, {pattern_key: [latest anomaly IDs, max 20]})
+    """
+    response = supabase.rpc('risk_counts_for_patterns', {'patterns': patterns}).execute()
+    counts = defaultdict(list)
+    top_ids = {}
+    for row in response.data or []:
+        counts[row['pattern_key']].append((row['risk'], row['status'], row['anomaly_count']))
+        top_ids[row['pattern_key']] = row['top_ids'] or []
+    return counts, top_ids
+
+def _anomaly_marker():
+    """Latest trigger-maintained updated_at and row count of anomalies, read in one request"""
+    row = supabase.rpc('anomalies_change_marker').execute().data[0]
+    return row['last_updated'], row['anomaly_count']
+
+async def calculate_and_update_all_risks(skip_if_unchanged: bool = False):
     """
     Calculate risk scores from anomalies and update all risk tables
     This should be called after agents run or anomalies are generated
+    With skip_if_unchanged, returns early when no anomaly was added, edited or removed since the last successful run
     """
+    global _last_anomaly_marker
     try:
-        print("Starting dynamic risk calculation...")
+        # The change marker is only read when the caller asked to skip unchanged runs
+        marker = None
+        if skip_if_unchanged:
+            marker = await asyncio.to_thread(_anomaly_marker)
+            if marker == _last_anomaly_marker:
+                log.info("Anomalies unchanged since last risk calculation, skipping")
+                return {"status": "skipped", "message": "No anomaly changes since last calculation"}
+        
+        log.info("Starting dynamic risk calculation")
         
         # Run all calculations in parallel
         await asyncio.gather(
             calculate_vendor_risks(),
             calculate_department_risks(),
             calculate_compliance_progress(),
-            update_risk_clusters(),
-            generate_risk_highlights()
+            update_risk_clusters()
         )
         
-        print("✓ Dynamic risk calculation completed")
+        # Highlights read the framework and department scores written above
+        await generate_risk_highlights()
+        
+        # Dashboards should see the new scores immediately
+        read_cache.clear()
+        if marker is not None:
+            _last_anomaly_marker = marker
+        
+        log.info("Dynamic risk calculation completed")
         return {"status": "success", "message": "All risks updated"}
-    except Exception as e:
-        print(f"Error in calculate_and_update_all_risks: {str(e)}")
+    except Exception:
+        log.exception("Error in calculate_and_update_all_risks")
         raise
 
 async def calculate_vendor_risks():
-    """Calculate vendor risk scores based on anomalies"""
+    """Calculate vendor risk scores based on anomalies (aggregated in the vendor_risk_calc view)"""
     try:
-        # Get all anomalies
-        anomalies_response = supabase.table('anomalies').select('*').execute()
-        anomalies = anomalies_response.data
-        
-        # Get all vendors
-        vendors_response = supabase.table('vendor_risk').select('*').execute()
-        vendors = vendors_response.data
+        response = await asyncio.to_thread(lambda: supabase.rpc('refresh_vendor_risks').execute())
+        vendors_updated = response.data or 0
         
-        # Calculate risk for each vendor
-        for vendor in vendors:
-            vendor_code = vendor['vendor_code']
-            vendor_name = vendor['vendor_name']
-            
-            # Find anomalies related to this vendor (in reasoning or agent notes)
-            vendor_anomalies = [
-                a for a in anomalies 
-                if vendor_code.lower() in a.get('reasoning', '').lower() or
-                   vendor_name.lower() in a.get('reasoning', '').lower()
-            ]
-            
-            # Calculate risk score
-            risk_score = 0
-            critical_count = 0
-            high_count = 0
-            
-            for anomaly in vendor_anomalies:
-                risk = anomaly.get('risk', 'Low')
-                if risk == 'Critical':
-                    risk_score += 25
-                    critical_count += 1
-                elif risk == 'High':
-                    risk_score += 15
-                    high_count += 1
-                elif risk == 'Medium':
-                    risk_score += 8
-                else:
-                    risk_score += 3
-            
-            # Determine risk level
-            if risk_score >= 75 or critical_count > 0:
-                risk_level = 'Critical'
-            elif risk_score >= 50 or high_count >= 2:
-                risk_level = 'High'
-            elif risk_score >= 30:
-                risk_level = 'Medium'
-            else:
-                risk_level = 'Low'
-            
-            # Update vendor risk
-            supabase.table('vendor_risk').update({
-                'risk_score': min(risk_score, 100),
-                'risk_level': risk_level,
-                'last_assessment': datetime.now().isoformat()
-            }).eq('vendor_code', vendor_code).execute()
-            
-            print(f"✓ Updated {vendor_code}: {risk_level} (score: {risk_score})")
-        
-        return {"status": "success", "vendors_updated": len(vendors)}
-    except Exception as e:
-        print(f"Error calculating vendor risks: {str(e)}")
+        log.info("Updated %d vendors", vendors_updated)
+        return {"status": "success", "vendors_updated": vendors_updated}
+    except Exception:
+        log.exception("Error calculating vendor risks")
         raise
 
 async def calculate_department_risks():
-    """Calculate department risk scores based on anomalies and findings"""
+    """Calculate department risk scores based on anomalies (aggregated in the department_risk_calc view)"""
     try:
-        # Get all anomalies
-        anomalies_response = supabase.table('anomalies').select('*').execute()
-        anomalies = anomalies_response.data
-        
-        # Department-Process mapping
-        dept_map = {
-            'IT': ['IT Change'],
-            'FINANCE': ['Procure-to-Pay', 'Record-to-Report'],
-            'OPS': ['Order-to-Cash'],
-            'PLANT': ['Order-to-Cash'],
-            'HR': ['Record-to-Report'],
-            'SALES': ['Order-to-Cash'],
-            'LEGAL': ['Risk & Compliance'],
-            'QA': ['Record-to-Report'],
-            'SUPPLY': ['Procure-to-Pay']
-        }
+        response = await asyncio.to_thread(lambda: supabase.rpc('refresh_department_risks').execute())
+        departments_updated = response.data or 0
         
-        for dept_code, processes in dept_map.items():
-            # Find anomalies in this department's processes
-            dept_anomalies = [
-                a for a in anomalies 
-                if a.get('process') in processes
-            ]
-            
-            # Calculate metrics
-            risk_score = 0
-            open_findings = 0
-            critical_issues = 0
-            
-            for anomaly in dept_anomalies:
-                if anomaly.get('status') in ['Open', 'In Progress']:
-                    open_findings += 1
-                
-                risk = anomaly.get('risk', 'Low')
-                if risk == 'Critical':
-                    risk_score += 20
-                    critical_issues += 1
-                elif risk == 'High':
-                    risk_score += 12
-                elif risk == 'Medium':
-                    risk_score += 6
-                else:
-                    risk_score += 2
-            
-            # Determine risk level
-            if critical_issues >= 3 or risk_score >= 80:
-                risk_level = 'Critical'
-            elif critical_issues >= 1 or risk_score >= 60:
-                risk_level = 'High'
-            elif risk_score >= 35:
-                risk_level = 'Medium'
-            else:
-                risk_level = 'Low'
-            
-            # Update department risk
-            supabase.table('department_risk').update({
-                'risk_score': min(risk_score, 100),
-                'risk_level': risk_level,
-                'open_findings': open_findings,
-                'critical_issues': critical_issues,
-                'last_assessment': datetime.now().isoformat()
-            }).eq('department_code', dept_code).execute()
-            
-            print(f"✓ Updated {dept_code}: {risk_level} (score: {risk_score}, {open_findings} open)")
-        
-        return {"status": "success", "departments_updated": len(dept_map)}
-    except Exception as e:
-        print(f"Error calculating department risks: {str(e)}")
+        log.info("Updated %d departments", departments_updated)
+        return {"status": "success", "departments_updated": departments_updated}
+    except Exception:
+        log.exception("Error calculating department risks")
         raise
 
 async def calculate_compliance_progress():
     """Calculate compliance framework progress from agent findings"""
     try:
-        # Get all anomalies
-        anomalies_response = supabase.table('anomalies').select('*').execute()
-        anomalies = anomalies_response.data
-        
         # Framework mapping (what issues affect which framework)
         framework_keywords = {
             'SOX': ['change', 'approval', 'sod', 'segregation', 'itgc', 'access'],
@@ -187,24 +135,25 @@ async def calculate_compliance_progress():
             'ESG': ['esg', 'supplier', 'sustainability', 'environmental', 'emissions']
         }
         
+        # Count related anomalies per framework by status, and get all framework info in one read
+        (framework_counts, _), frameworks_response = await asyncio.gather(
+            asyncio.to_thread(_pattern_risk_counts, framework_keywords),
+            asyncio.to_thread(lambda: supabase.table('compliance_frameworks').select('framework_code, total_controls, completion_percentage').in_('framework_code', list(framework_keywords)).execute())
+        )
+        frameworks = {f['framework_code']: f for f in frameworks_response.data}
+        
+        framework_updates = []
         for framework_code, keywords in framework_keywords.items():
-            # Get framework info
-            framework_response = supabase.table('compliance_frameworks').select('*').eq('framework_code', framework_code).execute()
-            if not framework_response.data:
+            framework = frameworks.get(framework_code)
+            if framework is None:
                 continue
             
-            framework = framework_response.data[0]
             total_controls = framework['total_controls']
             
-            # Find related anomalies
-            related_anomalies = [
-                a for a in anomalies
-                if any(keyword in a.get('reasoning', '').lower() for keyword in keywords)
-            ]
-            
             # Count open vs closed issues
-            open_issues = len([a for a in related_anomalies if a.get('status') in ['Open', 'In Progress']])
-            closed_issues = len([a for a in related_anomalies if a.get('status') == 'Closed'])
+            related_counts = framework_counts.get(framework_code, [])
+            open_issues = sum(count for _, status, count in related_counts if status in _OPEN_STATUSES)
+            closed_issues = sum(count for _, status, count in related_counts if status == 'Closed')
             
             # Calculate completion (inverse of open issues)
             # More open issues = lower completion
@@ -221,82 +170,74 @@ async def calculate_compliance_progress():
             
             completed_controls = int((new_completion / 100) * total_controls)
             
-            # Update framework
-            supabase.table('compliance_frameworks').update({
+            # Update framework (queued, the updates run concurrently below)
+            update = {
                 'completion_percentage': int(new_completion),
                 'completed_controls': completed_controls,
                 'last_updated': datetime.now().isoformat()
-            }).eq('framework_code', framework_code).execute()
+            }
+            framework_updates.append(asyncio.to_thread(
+                lambda code=framework_code, update=update: supabase.table('compliance_frameworks').update(update).eq('framework_code', code).execute()
+            ))
             
-            print(f"✓ Updated {framework_code}: {new_completion}% ({completed_controls}/{total_controls} controls)")
+            log.debug("Updated %s: %s%% (%d/%d controls)", framework_code, new_completion, completed_controls, total_controls)
+        
+        await asyncio.gather(*framework_updates)
+        log.info("Updated %d compliance frameworks", len(framework_updates))
         
         return {"status": "success"}
-    except Exception as e:
-        print(f"Error calculating compliance progress: {str(e)}")
+    except Exception:
+        log.exception("Error calculating compliance progress")
         raise
 
 async def update_risk_clusters():
     """Update risk clusters based on current anomalies"""
     try:
-        # Get all anomalies
-        anomalies_response = supabase.table('anomalies').select('*').execute()
-        anomalies = anomalies_response.data
+        # Count matching anomalies per cluster by risk, with each cluster's latest IDs
+        cluster_counts, cluster_top_ids = await asyncio.to_thread(_pattern_risk_counts, {
+            str(cluster_id): pattern['keywords'] for cluster_id, pattern in CLUSTER_PATTERNS.items()
+        })
         
-        # Cluster definitions (you can make this more sophisticated with ML later)
-        cluster_patterns = {
-            1: {'name': 'Payment Processing Issues', 'keywords': ['payment', 'invoice', 'duplicate', '3-way']},
-            2: {'name': 'Access Control Violations', 'keywords': ['sod', 'access', 'permission', 'admin']},
-            3: {'name': 'Invoice Matching Failures', 'keywords': ['invoice', 'match', 'approval']},
-            4: {'name': 'Vendor Compliance Gaps', 'keywords': ['vendor', 'supplier', 'certification']},
-            5: {'name': 'Data Privacy Concerns', 'keywords': ['gdpr', 'dpia', 'privacy', 'data']},
-            6: {'name': 'Change Management Defects', 'keywords': ['change', 'it', 'unapproved']},
-            7: {'name': 'Financial Reconciliation', 'keywords': ['reconciliation', 'gl', 'account']},
-            8: {'name': 'Procurement Workflow', 'keywords': ['po', 'procurement', 'purchase', 'approval']},
-            9: {'name': 'Asset Management', 'keywords': ['asset', 'inventory', 'tracking']},
-            10: {'name': 'Supplier Onboarding', 'keywords': ['onboarding', 'supplier', 'documentation']},
-            11: {'name': 'Contract Compliance', 'keywords': ['contract', 'terms', 'violation']},
-            12: {'name': 'ESG Reporting Gaps', 'keywords': ['esg', 'sustainability', 'emissions']}
-        }
-        
-        for cluster_id, pattern in cluster_patterns.items():
-            # Find anomalies matching this cluster
-            matching_anomalies = [
-                a for a in anomalies
-                if any(keyword in a.get('reasoning', '').lower() for keyword in pattern['keywords'])
-            ]
-            
-            # Determine dominant risk
-            risk_counts = {'Critical': 0, 'High': 0, 'Medium': 0, 'Low': 0}
-            for a in matching_anomalies:
-                risk_counts[a.get('risk', 'Low')] += 1
+        cluster_updates = []
+        for cluster_id, pattern in CLUSTER_PATTERNS.items():
+            # Determine dominant risk from the grouped counts (summed over statuses)
+            risk_counts = defaultdict(int)
+            for risk, _, count in cluster_counts.get(str(cluster_id), []):
+                risk_counts[risk or 'Low'] += count
             
-            dominant_risk = max(risk_counts, key=risk_counts.get) if matching_anomalies else 'Low'
+            cluster_size = sum(risk_counts.values())
+            dominant_risk = max(risk_counts, key=lambda risk: (risk_counts[risk], _RISK_SEVERITY.get(risk, -1)), default='Low')
             
-            # Update cluster
-            supabase.table('risk_clusters').update({
+            cluster_updates.append({
+                'cluster_id': cluster_id,
                 'cluster_name': pattern['name'],
-                'cluster_size': len(matching_anomalies),
+                'cluster_size': cluster_size,
                 'dominant_risk': dominant_risk,
-                'anomaly_ids': [a['id'] for a in matching_anomalies[:20]],  # Max 20 IDs
+                'anomaly_ids': cluster_top_ids.get(str(cluster_id), []),  # Max 20 IDs
                 'updated_at': datetime.now().isoformat()
-            }).eq('cluster_id', cluster_id).execute()
+            })
+        
+        # Update all clusters in one request
+        await asyncio.to_thread(lambda: supabase.table('risk_clusters').upsert(cluster_updates, on_conflict='cluster_id').execute())
         
-        print(f"✓ Updated {len(cluster_patterns)} risk clusters")
+        log.info("Updated %d risk clusters", len(CLUSTER_PATTERNS))
         return {"status": "success"}
-    except Exception as e:
-        print(f"Error updating clusters: {str(e)}")
+    except Exception:
+        log.exception("Error updating clusters")
         raise
 
 async def generate_risk_highlights():
     """Generate dynamic risk highlights based on current state"""
     try:
-        # Clear old highlights
-        supabase.table('risk_highlights').delete().neq('id', 0).execute()
-        
-        # Get current data
-        frameworks = supabase.table('compliance_frameworks').select('*').execute().data
-        departments = supabase.table('department_risk').select('*').order('risk_score', desc=True).limit(3).execute().data
-        anomalies = supabase.table('anomalies').select('*').eq('status', 'Open').execute().data
+        # Get current data, reading all tables concurrently (only open anomalies' risk levels are used)
+        frameworks_response, departments_response, anomalies_response = await asyncio.gather(
+            asyncio.to_thread(lambda: supabase.table('compliance_frameworks').select('framework_name, completion_percentage, focus_area').execute()),
+            asyncio.to_thread(lambda: supabase.table('department_risk').select('department_name, critical_issues').order('risk_score', desc=True).limit(3).execute()),
+            asyncio.to_thread(lambda: supabase.table('anomalies').select('id, risk').eq('status', 'Open').execute())
+        )
+        frameworks = frameworks_response.data
+        departments = departments_response.data
+        open_anomalies = anomalies_response.data
         
         highlights = []
         
@@ -329,7 +270,7 @@ async def generate_risk_highlights():
                 })
         
         # Anomaly trends
-        critical_anomalies = [a for a in anomalies if a.get('risk') == 'Critical']
+        critical_anomalies = [a for a in open_anomalies if a.get('risk') == 'Critical']
         if len(critical_anomalies) > 5:
             highlights.append({
                 'highlight_text': f"{len(critical_anomalies)} critical anomalies detected - recommend immediate review",
@@ -338,63 +279,67 @@ async def generate_risk_highlights():
                 'is_active': True
             })
         
-        # Insert highlights (limit to top 5)
-        for highlight in highlights[:5]:
-            supabase.table('risk_highlights').insert(highlight).execute()
+        # Replace old highlights with the top 5 in one transaction
+        await asyncio.to_thread(lambda: supabase.rpc('refresh_risk_highlights', {'payload': highlights[:5]}).execute())
         
-        print(f"✓ Generated {len(highlights[:5])} risk highlights")
+        log.info("Generated %d risk highlights", len(highlights[:5]))
         return {"status": "success", "highlights_generated": len(highlights[:5])}
-    except Exception as e:
-        print(f"Error generating highlights: {str(e)}")
+    except Exception:
+        log.exception("Error generating highlights")
         raise
 
 # ============================================
 # EXISTING FUNCTIONS (keep all of these)
 # ============================================
 
+@cached_read
 async def get_vendor_risk():
     """Get all vendor risk data"""
     try:
-        response = supabase.table('vendor_risk').select('*').order('vendor_code').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('vendor_risk').select('*').order('vendor_code').execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting vendor risk: {str(e)}")
+    except Exception:
+        log.exception("Error getting vendor risk")
         raise
 
+@cached_read
 async def get_department_risk():
     """Get all department risk data"""
     try:
-        response = supabase.table('department_risk').select('*').order('department_code').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('department_risk').select('*').order('department_code').execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting department risk: {str(e)}")
+    except Exception:
+        log.exception("Error getting department risk")
         raise
 
+@cached_read
 async def get_compliance_frameworks():
     """Get all compliance framework data"""
     try:
-        response = supabase.table('compliance_frameworks').select('*').order('framework_code').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('compliance_frameworks').select('*').order('framework_code').execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting compliance frameworks: {str(e)}")
+    except Exception:
+        log.exception("Error getting compliance frameworks")
         raise
 
+@cached_read
 async def get_risk_clusters():
     """Get all risk cluster data"""
     try:
-        response = supabase.table('risk_clusters').select('*').order('cluster_id').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('risk_clusters').select('*').order('cluster_id').execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting risk clusters: {str(e)}")
+    except Exception:
+        log.exception("Error getting risk clusters")
         raise
 
+@cached_read
 async def get_risk_highlights():
     """Get active risk highlights"""
     try:
-        response = supabase.table('risk_highlights').select('*').eq('is_active', True).execute()
+        response = await asyncio.to_thread(lambda: supabase.table('risk_highlights').select('*').eq('is_active', True).execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting risk highlights: {str(e)}")
+    except Exception:
+        log.exception("Error getting risk highlights")
         raise
 
 async def get_all_risk_data():
@@ -416,17 +361,17 @@ async def get_all_risk_data():
             "risk_clusters": results[3] if not isinstance(results[3], Exception) else [],
             "risk_highlights": results[4] if not isinstance(results[4], Exception) else []
         }
-    except Exception as e:
-        print(f"Error getting all risk data: {str(e)}")
+    except Exception:
+        log.exception("Error getting all risk data")
         raise
 
 async def get_vendor_anomalies(vendor_code: str):
     """Get anomalies related to a specific vendor"""
     try:
-        response = supabase.table('anomalies').select('*').ilike('reasoning', f'%{vendor_code}%').execute()
+        response = await asyncio.to_thread(lambda: supabase.table('anomalies').select('*').ilike('reasoning', f'%{vendor_code}%').execute())
         return response.data
-    except Exception as e:
-        print(f"Error getting vendor anomalies: {str(e)}")
+    except Exception:
+        log.exception("Error getting vendor anomalies")
         raise
 
 async def get_department_anomalies(department_code: str):
@@ -442,32 +387,27 @@ async def get_department_anomalies(department_code: str):
         
         process = dept_process_map.get(department_code, '')
         if process:
-            response = supabase.table('anomalies').select('*').eq('process', process).execute()
+            response = await asyncio.to_thread(lambda: supabase.table('anomalies').select('*').eq('process', process).execute())
             return response.data
         return []
-    except Exception as e:
-        print(f"Error getting department anomalies: {str(e)}")
+    except Exception:
+        log.exception("Error getting department anomalies")
         raise
 
 async def get_cluster_anomalies(cluster_id: int):
     """Get all anomalies in a specific cluster"""
     try:
-        cluster = supabase.table('risk_clusters').select('*').eq('cluster_id', cluster_id).execute()
+        cluster = await asyncio.to_thread(lambda: supabase.table('risk_clusters').select('*').eq('cluster_id', cluster_id).execute())
         
         if cluster.data and cluster.data[0]['anomaly_ids']:
             anomaly_ids = cluster.data[0]['anomaly_ids']
-            anomalies = []
-            
-            for anomaly_id in anomaly_ids:
-                response = supabase.table('anomalies').select('*').eq('id', anomaly_id).execute()
-                if response.data:
-                    anomalies.extend(response.data)
+            anomalies = (await asyncio.to_thread(lambda: supabase.table('anomalies').select('*').in_('id', anomaly_ids).execute())).data
             
             return {
                 "cluster": cluster.data[0],
                 "anomalies": anomalies
             }
         return {"cluster": cluster.data[0] if cluster.data else None, "anomalies": []}
-    except Exception as e:
-        print(f"Error getting cluster anomalies: {str(e)}")
+    except Exception:
+        log.exception("Error getting cluster anomalies")
         raise
@@ -0,0 +1,65 @@
+"""
+Semantic cache for document searches - reuses results for near-identical query embeddings
+"""
+import numpy as np
+from config import settings
+
+CACHE_CAPACITY = 256
+SIMILARITY_THRESHOLD = 0.95
+
+# Ring buffer of normalized query embeddings and the search results they produced
+_query_embeddings = np.zeros((CACHE_CAPACITY, settings.EMBEDDING_DIMENSION), dtype=np.float32)
+_query_ks = np.zeros(CACHE_CAPACITY, dtype=np.int32)
+_results = [None] * CACHE_CAPACITY
+_size = 0
+_next_slot = 0
+
+
+def _normalize(embedding):
+    """Unit-length float32 copy of an embedding, or None if it is empty, zero, non-finite or the wrong size"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    if vector.shape != (settings.EMBEDDING_DIMENSION,):
+        return None
+    norm = np.linalg.norm(vector)
+    if not np.isfinite(norm) or norm == 0:
+        return None
+    return vector / norm
+
+
+def get(query_embedding, k):
+    """Return cached results for a query within the similarity threshold, or None"""
+    if _size == 0:
+        return None
+
+    vector = _normalize(query_embedding)
+    if vector is None:
+        return None
+
+    sims = _query_embeddings[:_size] @ vector
+    sims[_query_ks[:_size] != k] = -1.0
+    best = int(sims.argmax())
+    if sims[best] > SIMILARITY_THRESHOLD:
+        return _results[best]
+    return None
+
+
+def put(query_embedding, k, result):
+    """Store search results, evicting the oldest entry once the cache is full"""
+    global _size, _next_slot
+    vector = _normalize(query_embedding)
+    if vector is None:
+        return
+
+    _query_embeddings[_next_slot] = vector
+    _query_ks[_next_slot] = k
+    _results[_next_slot] = result
+    _next_slot = (_next_slot + 1) % CACHE_CAPACITY
+    _size = min(_size + 1, CACHE_CAPACITY)
+
+
+def clear():
+    """Drop all cached results (call after new document chunks are stored)"""
+    global _size, _next_slot
+    _results[:] = [None] * CACHE_CAPACITY
+    _size = 0
+    _next_slot = 0